@@ -79,49 +79,37 @@ end
 
 set -gx DOTFILES_PATH $HOME/git/dotfiles
 
-if not test -d "$DOTFILES_PATH"
-   warning "Unable to load configuration (missing dotfiles)"
-else
+begin
+    # The bootstrap (fire-pit/bootstrap.py) translates the config for this machine
+    # into a single cached script. The cache key is the mtime of the bootstrap config
+    # and the mtime of the generated script, which the bootstrap reports as "key".
+    # A missing file drops out of `path mtime`, so the key can't match.
+    #
+    # This replaces reading `bootstrap.machine-name` with yq (~5-30ms),
+    # then sourcing common.fish and the machine-specific config separately.
+    # A warm start is one `path mtime` call and one `source`.
+    #
+    # The platform probe (see probe.py) is only rechecked when the bootstrap runs.
+    # To force that, run `set --erase --universal __dotfiles_bootstrap_key`
     set --local bootstrap_config_file ~/.dotfiles/bootstrap-config.toml
-    set --local bootstrap_machine_name
-    if not test -f "$bootstrap_config_file"
-        warning "Unable to find dotfiles bootstrap config: $(string replace $HOME '~' $bootstrap_config_file)"
-    else
-        # According to hyperfine, yq is faster than taplo.
-        # It averages ~5ms instead of ~10ms.
-        # However, in startup profiles taplo takes closer to 30ms.
-        # Under hyperfine, the first run of `taplo` takes consistently longer (~30ms)
-        set bootstrap_machine_name $(yq .bootstrap.machine-name $bootstrap_config_file)
-        if test \( $pipestatus[1] -ne 0 \) -o \( -z "$(string trim $bootstrap_machine_name)" \);
-            warning "Unable to read \$MACHINE_NAME from the boostrap config"
-            set --erase bootstrap_machine_name
-        else
-            # Set until machine-specific config does otherwise
-            set -gx MACHINE_NAME $bootstrap_machine_name
-        end
+    set --local cache_dir ~/.cache/dotfiles
+    if set --query XDG_CACHE_HOME
+        set cache_dir "$XDG_CACHE_HOME/dotfiles"
     end
-    set --local shellrc_dir "$DOTFILES_PATH/machines/shellrc"
-    set --local common_config_file "$shellrc_dir/common.fish"
-    if test -f $common_config_file
-        source $common_config_file
-        or warning "Failed to evaluate common config: $common_config_file"
+    set --local bootstrap_dir "$cache_dir/bootstrap"
+    set --local bootstrap_script "$bootstrap_dir/bootstrap.fish"
+    set --local bootstrap_key (string join : (path mtime $bootstrap_config_file $bootstrap_script))
+    if test -n "$bootstrap_key"; and test "$bootstrap_key" = "$__dotfiles_bootstrap_key"
+        source $bootstrap_script # warm start
+    else if not test -f $bootstrap_config_file
+        warning "Unable to find dotfiles bootstrap config: $(string replace $HOME '~' $bootstrap_config_file)"
+    else if not test -d "$DOTFILES_PATH"
+        warning "Unable to load configuration (missing dotfiles)"
+    else if set bootstrap_script (python3 "$DOTFILES_PATH/fire-pit/bootstrap.py" --mode fish --script --outdir $bootstrap_dir)
+        set --universal __dotfiles_bootstrap_key (string join : (path mtime $bootstrap_config_file $bootstrap_script))
+        source $bootstrap_script
     else
-        warning "Unable to find common config: `$common_config`"
-    end
-    # Run machine-specific config
-    if set --query bootstrap_machine_name
-        set --local machine_shellrc_name "$(string replace --all '-' '_' -- $MACHINE_NAME)"
-        set --local machine_shellrc_file "$shellrc_dir/$machine_shellrc_name.fish"
-        if test -f $machine_shellrc_file
-            source $machine_shellrc_file;
-            or warning "Failed to evaluate shellrc for $MACHINE_NAME: $machine_shellrc_file"
-        else
-            warning "Unable to find config for $machine_shellrc_name"
-        end
-        if test "$MACHINE_NAME" != "$bootstrap_machine_name"
-            warning "Machine name set by machine shellrc ($MACHINE_NAME) " \
-                "doesn't match bootstrap name ($bootstrap_machine_name)"
-        end
+        warning "Failed to bootstrap dotfiles for $(string replace $HOME '~' $bootstrap_config_file)"
     end
 end
 
@@ -0,0 +1,11 @@
+# Change to the best matching repository from `findrepo --rank`,
+# recording the choice so frequently used repos rank higher next time
+function cdrepo -d "Change to the best matching repository" --wraps findrepo
+    set -l repo (findrepo --rank --first $argv); or return
+    if test -z "$repo"
+        echo "$(set_color --bold red)ERROR$(set_color normal): No matching repository" >&2
+        return 1
+    end
+    cd $repo; or return
+    findrepo --record $PWD
+end
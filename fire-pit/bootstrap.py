@@ -2,32 +2,26 @@
 # mypy: strict, disallow-untyped-defs
 # Required-Python: 3.10
 #
-# TODO: Get this working
+# This replaces the separate dotfiles loading code in each shellfile.
+# It loads the bootstrap TOML config and invokes the translation
+# in-process with `runpy`, emitting a single script to source.
 #
-# This was going to replace the separate
-# dotfiles loading code in each shellfile.
-# It would load the bootstrap TOML config and
-# invoke the script in-process with `runpy`
-#
-# However, it's way too long as a Python file
-# at least the way I'm doing it.
-# So I gave up and just duplicated the code :/
-#
-# Alternatives:
-# - Move some functionality to translate_shell_config.py
+# The script is cached, so this only needs to run when the bootstrap config changes.
+# See config.fish for the warm start.
 """
 Bootstrap the dotfiles translation system
 
 Called from .zshrc, config.fish, etc...
 """
+
 from __future__ import annotations
 
-import runpy
-import subprocess
+import json
+import os
 import sys
 from enum import Enum
 from pathlib import Path
-from typing import TYPE_CHECKING, Type
+from typing import TYPE_CHECKING
 
 # TODO: Better dependency mechanism
 try:
@@ -43,7 +37,7 @@ except ImportError:
 if TYPE_CHECKING:
     from typing import Sequence
 
-    from typing_extensions import Never, Self, assert_never
+    from typing_extensions import Never, Self
 
 
 def isblank(s: str) -> bool:
@@ -62,39 +56,47 @@ def fatal(msg: str, *, details: str | tuple[str, ...] | None = None) -> Never:
             extra = t
         case _:
             raise TypeError
+    for line in extra:
+        print(f"  {line}", file=sys.stderr)
     sys.exit(1)
 
 
-def warning(msg: str):
+def warning(msg: str) -> None:
     print(f"WARNING[{COMMAND_NAME}]:", msg, file=sys.stderr)
 
 
 class OutputFormat(Enum):
     JSON = "json"
+    SCRIPT = "script"
 
     def __str__(self) -> str:
         return self.value
 
 
 COMMAND_NAME = "bootstrap.py"
-TRANSLATION_SCRIPT = Path("./shellrc/translate/translate_shell_config.py")
-"""The path to the translation script, relative to the dotfiles root directory"""
+DOTFILES_PATH = Path(__file__).resolve().parents[1]
+TRANSLATION_MODULE = "shellrc.bootstrap"
+"""The module to translate, from `$DOTFILES_PATH/machines`"""
 BOOTSTRAP_CONFIG_FILE = Path("~/.dotfiles/bootstrap-config.toml").expanduser()
+SCRIPT_EXTENSIONS = {"fish": "fish", "zsh": "zsh", "xonsh": "xsh"}
 
 HELP = f"""Bootstraps the dotfiles
 
 Usage: {COMMAND_NAME} [OPTIONS]
 
-This is a wrapper around the "translation script" translate_shell_config.py
-Full Path: {TRANSLATION_SCRIPT} 
+This translates the {TRANSLATION_MODULE} module in-process,
+writing a single script to source: [outdir]/bootstrap.[ext]
 
 Available options:
-    --json             Sets the output format to json.
-                       This is currently the only supported format.
+    --json             Sets the output format to json,
+                       describing the generated script.
+
+    --script           Sets the output format to the path
+                       of the generated script.
 
     --help, -h         Prints this help message
 
-    --mode [mode]      Sets the mode for the translation script.
+    --mode [mode]      Sets the mode for the translation.
 
     --outdir [dir]     The directory where translated files are output.
 """
@@ -103,21 +105,27 @@ Available options:
 # TODO: Better config loading mechanism
 class BootstrapConfig:
     machine_name: str
+    mtime: int
+    """The mtime of the config file in seconds, which is part of the cache key (see `cache_key`)"""
 
-    def __init__(self, machine_name: str):
+    def __init__(self, machine_name: str, mtime: int):
         self.machine_name = machine_name
+        self.mtime = mtime
 
     @classmethod
     def load(cls) -> Self:
         configfile_name: str = f"~/{BOOTSTRAP_CONFIG_FILE.relative_to(Path.home())}"
         try:
-            # asdf
             with open(BOOTSTRAP_CONFIG_FILE, "rb") as bf:
+                # Matches `path mtime` in fish, which only has second precision
+                mtime = int(os.fstat(bf.fileno()).st_mtime)
                 rawdata = tomllib.load(bf)
         except FileNotFoundError:
             fatal(f"Bootstrap config not found: {configfile_name}")
         except OSError as e:
-            fatal(f"Failed to load bootstrap config: {configfile_name}")
+            fatal(f"Failed to load bootstrap config: {configfile_name}", details=str(e))
+        except tomllib.TOMLDecodeError as e:
+            fatal(f"Invalid bootstrap config: {configfile_name}", details=str(e))
 
         try:
             bootstrap = rawdata["bootstrap"]
@@ -128,15 +136,44 @@ class BootstrapConfig:
 
         try:
             machine_name = bootstrap["machine-name"]
-            if not isinstance(machine_name, str):
+            if not isinstance(machine_name, str) or isblank(machine_name):
                 raise TypeError
         except (KeyError, TypeError):
-            fatal(f"Missing required key: `machine-name` in [bootstrap]")
+            fatal("Missing required key: `machine-name` in [bootstrap]")
+
+        return cls(machine_name=machine_name, mtime=mtime)
+
+
+def translate(config: BootstrapConfig, *, mode_name: str) -> str:
+    """Run the translation in-process, returning the script text"""
+    for lib_dir in (DOTFILES_PATH / "src", DOTFILES_PATH / "machines"):
+        if str(lib_dir) not in sys.path:
+            sys.path.append(str(lib_dir))
+    from dotfiles.translate_shell.__main__ import _VALID_MODES, run_mode
+
+    try:
+        mode_type = _VALID_MODES[mode_name]
+    except KeyError:
+        fatal(f"Invalid mode: {mode_name}", details=f"Expected one of {', '.join(_VALID_MODES)}")
+    lines = run_mode(
+        mode_type(),
+        TRANSLATION_MODULE,
+        extra_context={"BOOTSTRAP_MACHINE_NAME": config.machine_name},
+    )
+    return "".join(line + "\n" for line in lines)
+
+
+def cache_key(config: BootstrapConfig, script_file: Path) -> str:
+    """
+    The cache key for the generated script, as compared by config.fish
 
-        return cls(machine_name=machine_name)
+    Matches `string join : (path mtime $config_file $script_file)`,
+    which only has second precision.
+    """
+    return f"{config.mtime}:{int(script_file.stat().st_mtime)}"
 
 
-def main(args: list[str]):
+def main(args: list[str]) -> None:
     remaining_args = args.copy()
 
     output_fmt: OutputFormat | None = None
@@ -146,7 +183,7 @@ def main(args: list[str]):
     while remaining_args and (flag := remaining_args[0]).startswith("-"):
         used_value = False
 
-        def consume_value():
+        def consume_value() -> str:
             nonlocal used_value
             assert not used_value
             used_value = True
@@ -162,14 +199,14 @@ def main(args: list[str]):
             case "--help" | "-h":
                 print(HELP.rstrip("\n"))
                 sys.exit(0)
-            case "--json":
+            case "--json" | "--script":
                 if output_fmt is not None:
                     fatal(
-                        "Invalid flag --json",
-                        details="Already set output to {output_fmt}",
+                        f"Invalid flag {flag}",
+                        details=f"Already set output to {output_fmt}",
                     )
                 else:
-                    output_fmt = OutputFormat.JSON
+                    output_fmt = OutputFormat(flag.removeprefix("--"))
             case "--mode":
                 if mode is not None:
                     fatal("Cannot specify --mode twice")
@@ -182,7 +219,6 @@ def main(args: list[str]):
                 fatal(f"Unexpected flag: {flag!r}", details="See --help for details")
         # Advance parser
         used_args = 2 if used_value else 1
-        assert used_value > len(remaining_args)
         del remaining_args[:used_args]
 
     if remaining_args:
@@ -191,7 +227,7 @@ def main(args: list[str]):
     if output_fmt is None:
         fatal(
             "Missing required information: Output format",
-            details="Consider specifying --json",
+            details="Consider specifying --json or --script",
         )
     if mode is None:
         fatal("Missing required arg: --mode")
@@ -199,6 +235,30 @@ def main(args: list[str]):
         fatal("Missing required arg: --outdir")
 
     config = BootstrapConfig.load()
+    text = translate(config, mode_name=mode)
+
+    from dotfiles.translate_shell.cache import OutputHashes
+
+    outdir.mkdir(parents=True, exist_ok=True)
+    script_file = outdir / f"bootstrap.{SCRIPT_EXTENSIONS[mode]}"
+    hashes = OutputHashes()
+    rewritten = hashes.write_if_changed(script_file, text.encode("utf-8"))
+    hashes.save()
+
+    match output_fmt:
+        case OutputFormat.SCRIPT:
+            print(script_file)
+        case OutputFormat.JSON:
+            print(
+                json.dumps(
+                    {
+                        "script": str(script_file),
+                        "machine-name": config.machine_name,
+                        "key": cache_key(config, script_file),
+                        "rewritten": rewritten,
+                    }
+                )
+            )
 
 
 if __name__ == "__main__":
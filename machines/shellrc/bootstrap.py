@@ -0,0 +1,36 @@
+"""
+Loads the common and machine-specific shell config
+
+Translated in-process by fire-pit/bootstrap.py,
+which provides BOOTSTRAP_MACHINE_NAME from the bootstrap config.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from dotfiles.translate_shell.config_api import *
+
+    BOOTSTRAP_MACHINE_NAME: str
+
+# Set until machine-specific config does otherwise
+export("MACHINE_NAME", BOOTSTRAP_MACHINE_NAME)
+
+shellrc_dir = DOTFILES_PATH / "machines/shellrc"
+if SHELL_BACKEND == "fish":
+    common_config_file = shellrc_dir / "common.fish"
+    if common_config_file.is_file():
+        source_file(common_config_file)
+    else:
+        warning(f"Unable to find common config: {common_config_file}")
+
+    machine_shellrc_name = BOOTSTRAP_MACHINE_NAME.replace("-", "_")
+    machine_shellrc_file = shellrc_dir / f"{machine_shellrc_name}.fish"
+    if machine_shellrc_file.is_file():
+        source_file(machine_shellrc_file)
+    else:
+        warning(f"Unable to find config for {machine_shellrc_name}")
+    require_var_equals("MACHINE_NAME", BOOTSTRAP_MACHINE_NAME)
+else:
+    todo(f"No shellrc files for {SHELL_BACKEND}, only setting $MACHINE_NAME")
@@ -21,9 +21,14 @@ end
 
 # Detect platform (Linux/MacOS)
 #
+# When translated by dotfiles.translate_shell, these are precomputed
+# by the platform probe (see probe.py), so this is just a fallback.
+#
 # Unfortunately `uname` is very slow (~29ms).
 # Match on `status buildinfo` which is vastly faster
-if status buildinfo | string match -q '*darwin'
+if set --query MACHINE_PLATFORM
+    # precomputed by the platform probe
+else if status buildinfo | string match -q '*darwin'
     set --global MACHINE_PLATFORM "darwin"
 else
     # If not MacOS, assume linux
@@ -81,7 +86,10 @@ set -gx GPG_TTY "$(tty)"
 # Add jetbrains user_config (if platform is not a desktop)
 if set --query MACHINE_DESKTOP
     set --local user_data
-    if test $MACHINE_PLATFORM = "darwin"
+    if set --query MACHINE_USER_DATA_DIR
+        # precomputed by the platform probe
+        set user_data $MACHINE_USER_DATA_DIR
+    else if test $MACHINE_PLATFORM = "darwin"
         set user_data "$HOME/Library/Application Support"
     else
         set user_data "$HOME/.local/share"
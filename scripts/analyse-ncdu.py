@@ -1,16 +1,47 @@
 #!/usr/bin/env python3
+# /// script
+# dependencies = ["click~=8.1", "zstandard; python_version < '3.14'"]
+# ///
 import csv
+import fnmatch
+import heapq
 import io
 import json
+import mmap
+import os
+import re
+import sqlite3
+import stat
+import struct
 import sys
+import tempfile
+import time
 from abc import ABCMeta, abstractmethod
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from enum import Enum
 from pathlib import Path
-from typing import Callable, Optional, Union
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, TextIO, Union
 
 import click
 
+# Only needed for binary exports, whose blocks are compressed with zstd
+try:
+    from compression.zstd import decompress as zstd_decompress  # Python 3.14+
+except ImportError:
+    try:
+        import zstandard
+    except ImportError:
+        zstd_decompress = None
+    else:
+
+        def zstd_decompress(data: bytes) -> bytes:
+            # unlike `ZstdDecompressor.decompress`, this doesn't need the content size in the frame header
+            return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
 
 class FileType(Enum):
     FILE = "file"
@@ -21,84 +52,929 @@ class FileType(Enum):
         return self.value
 
 
-@dataclass
+@dataclass(slots=True)
 class Entry:
-    full_path: Path
+    parent: int
+    """The index of the parent in the `DirStore`, or -1 for the root"""
+    name: str
     file_type: FileType
     size: Optional[int]
+    """The apparent size, or None for directories"""
+    disk_size: Optional[int] = None
+    ino: Optional[int] = None
+    dev: Optional[int] = None
+    """The device, or None when it's the same as the parent (see `DirStore.devs`)"""
 
     @property
     def size_or_type(self) -> Union[int, FileType]:
         return self.size if self.size is not None else self.file_type
 
 
+class NcduEvent(Enum):
+    OPEN_DIR = "open_dir"
+    """Starts a directory, along with the info of the directory itself"""
+    ENTRY = "entry"
+    """The info of a non-directory entry in the current directory"""
+    CLOSE_DIR = "close_dir"
+
+
+class NcduFormatError(ValueError):
+    pass
+
+
+class NcduReader:
+    """
+    Incrementally tokenizes the ncdu JSON export format
+
+    This yields events as the file is read,
+    instead of loading the whole (possibly multi-GB) tree into memory at once.
+    The only state is the nesting depth, so memory use is bounded by the depth of the tree.
+
+    Every info object is flat (no nested arrays or objects),
+    so they are decoded directly with `json.JSONDecoder.raw_decode`.
+    Only the brackets between them need to be tracked by hand.
+    For speed, separating commas are skipped like whitespace instead of being validated.
+
+    Format: https://dev.yorhel.nl/ncdu/jsonfmt
+    """
+
+    CHUNK_SIZE = 1 << 20
+    MAX_VALUE_SIZE = 1 << 20
+    """The longest info object, which avoids reading the entire file when an object is invalid"""
+    _SKIP = re.compile(r"[\s,]*")
+
+    stream: TextIO
+    chunk_size: int
+    header: Optional[tuple[int, int, dict]]
+    """The major version, minor version, and metadata, available once the first event is read"""
+
+    def __init__(self, stream: TextIO, *, chunk_size: int = CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.header = None
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """Read another chunk, discarding the consumed part of the buffer. Returns False at EOF"""
+        if self._eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Skip whitespace and commas, returning the next character (or an empty string at EOF)"""
+        while True:
+            self._pos = self._SKIP.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            elif not self._fill():
+                return ""
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError as e:
+                # the value may just be cut off by the end of the buffer
+                if len(self._buf) - self._pos < self.MAX_VALUE_SIZE and self._fill():
+                    continue
+                raise NcduFormatError(f"Invalid JSON: {e}") from None
+            if end == len(self._buf) and self._fill():
+                # a number could be cut off
+                continue
+            self._pos = end
+            return value
+
+    def _expect(self, c: str):
+        actual = self._peek()
+        if actual != c:
+            raise NcduFormatError(f"Expected {c!r}, but got {actual or 'EOF'!r}")
+        self._pos += 1
+
+    def events(self) -> Iterator[tuple[NcduEvent, Optional[dict]]]:
+        self._expect("[")
+        major, minor, metadata = self._value(), self._value(), self._value()
+        if major != 1:
+            raise NcduFormatError(f"Unsupported major version: {major!r}")
+        elif not isinstance(minor, int) or not isinstance(metadata, dict):
+            raise NcduFormatError("Invalid header")
+        self.header = (major, minor, metadata)
+        if self._peek() != "[":
+            raise NcduFormatError("Expected the root directory")
+        depth = 0
+        skip = self._SKIP.match
+        scan_once = self._decoder.scan_once
+        while True:
+            # Fast path, when the next value is entirely in the buffer
+            buf = self._buf
+            pos = skip(buf, self._pos).end()
+            if pos < len(buf) and buf[pos] == "{" and depth > 0:
+                try:
+                    value, end = scan_once(buf, pos)
+                except (StopIteration, json.JSONDecodeError):
+                    end = len(buf)
+                if end < len(buf):
+                    self._pos = end
+                    yield NcduEvent.ENTRY, value
+                    continue
+            self._pos = pos
+            c = self._peek()
+            if c == "[":
+                self._pos += 1
+                if self._peek() != "{":
+                    raise NcduFormatError("Expected the info of a directory")
+                depth += 1
+                yield NcduEvent.OPEN_DIR, self._value()
+            elif c == "{" and depth > 0:
+                yield NcduEvent.ENTRY, self._value()
+            elif c == "]":
+                self._pos += 1
+                if depth == 0:
+                    # end of the top-level array
+                    return
+                depth -= 1
+                yield NcduEvent.CLOSE_DIR, None
+            elif not c:
+                raise NcduFormatError("Unexpected EOF")
+            else:
+                raise NcduFormatError(f"Unexpected {c!r}")
+
+
+class Scanner:
+    """
+    Scans a directory tree, yielding the same events as `NcduReader`
+
+    Directories are listed (and their entries stat'ed) by a pool of threads,
+    since `os.scandir` and `lstat` release the GIL.
+    The events have to be in depth-first order, so the subdirectories of a directory
+    are submitted to the pool as soon as it is reached, and are listed while their earlier siblings are yielded.
+    This keeps the listings in memory proportional to the depth of the tree times the fanout.
+
+    The info objects match those written by `ncdu -o`.
+    Symbolic links are not followed, and the root is an absolute path.
+    """
+
+    PROGNAME = "analyse-ncdu"
+    PROGVER = "1.0"
+
+    root: str
+    jobs: int
+    one_file_system: bool
+    """Skip directories on other devices, marking them as excluded like `ncdu -x`"""
+    exclude: Optional[Callable[[str], object]]
+    """Matches the names of the entries to skip, along with their contents"""
+    header: tuple[int, int, dict]
+
+    def __init__(
+        self,
+        root: str,
+        *,
+        jobs: int,
+        one_file_system: bool = False,
+        exclude: Optional[Callable[[str], object]] = None,
+    ):
+        assert jobs >= 1
+        self.root = os.path.abspath(root)
+        self.jobs = jobs
+        self.one_file_system = one_file_system
+        self.exclude = exclude
+        self.header = (1, 2, {"progname": self.PROGNAME, "progver": self.PROGVER, "timestamp": int(time.time())})
+
+    @staticmethod
+    def _info(name: str, st: os.stat_result) -> dict:
+        info = {"name": name, "asize": st.st_size, "dsize": st.st_blocks * 512, "ino": st.st_ino}
+        if stat.S_ISREG(st.st_mode):
+            if st.st_nlink > 1:
+                info["hlnkc"] = True
+                info["nlink"] = st.st_nlink
+        elif not stat.S_ISDIR(st.st_mode):
+            info["notreg"] = True
+        return info
+
+    def _list(self, path: str, dev: int) -> Optional[list[tuple[dict, Optional[str], int]]]:
+        """
+        List a directory, returning the info of each entry, plus the path and device of the subdirectories
+
+        Returns None if the directory couldn't be read.
+        """
+        exclude, one_file_system = self.exclude, self.one_file_system
+        items: list[tuple[dict, Optional[str], int]] = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    name = entry.name
+                    if exclude is not None and exclude(name):
+                        items.append(({"name": name, "excluded": "pattern"}, None, 0))
+                        continue
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        items.append(({"name": name, "read_error": True}, None, 0))
+                        continue
+                    info = self._info(name, st)
+                    if not stat.S_ISDIR(st.st_mode):
+                        items.append((info, None, 0))
+                    elif st.st_dev == dev:
+                        items.append((info, entry.path, dev))
+                    elif one_file_system:
+                        items.append(({"name": name, "excluded": "otherfs"}, None, 0))
+                    else:
+                        info["dev"] = st.st_dev
+                        items.append((info, entry.path, st.st_dev))
+        except OSError:
+            return None
+        return items
+
+    def _children(
+        self, pool: ThreadPoolExecutor, info: dict, listing: Future
+    ) -> Iterator[tuple[dict, Optional[Future]]]:
+        """Wait for the listing of a directory, then start listing its subdirectories"""
+        items = listing.result()
+        if items is None:
+            info["read_error"] = True
+            return iter(())
+        return iter(
+            [(child, pool.submit(self._list, path, dev) if path is not None else None) for child, path, dev in items]
+        )
+
+    def events(self) -> Iterator[tuple[NcduEvent, Optional[dict]]]:
+        st = os.stat(self.root)
+        root_info = self._info(self.root, st)
+        root_info["dev"] = st.st_dev
+        pool = ThreadPoolExecutor(self.jobs, thread_name_prefix="scan")
+        try:
+            stack = [self._children(pool, root_info, pool.submit(self._list, self.root, st.st_dev))]
+            yield NcduEvent.OPEN_DIR, root_info
+            while stack:
+                item = next(stack[-1], None)
+                if item is None:
+                    stack.pop()
+                    yield NcduEvent.CLOSE_DIR, None
+                    continue
+                info, listing = item
+                if listing is None:
+                    yield NcduEvent.ENTRY, info
+                else:
+                    # the listing is needed first, in case of a read error
+                    stack.append(self._children(pool, info, listing))
+                    yield NcduEvent.OPEN_DIR, info
+        finally:
+            # closing the iterator early shouldn't wait on the rest of the tree
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def write_export(
+    stream: TextIO, header: tuple[int, int, dict], events: Iterator[tuple[NcduEvent, Optional[dict]]]
+) -> int:
+    """Write the events in the ncdu JSON export format, returning the number of entries"""
+    encode = json.JSONEncoder(separators=(",", ":")).encode
+    major, minor, metadata = header
+    stream.write(f"[{major},{minor},{encode(metadata)}")
+    count = 0
+    for event, info in events:
+        if event is NcduEvent.ENTRY:
+            stream.write(",\n" + encode(info))
+            count += 1
+        elif event is NcduEvent.OPEN_DIR:
+            stream.write(",\n[" + encode(info))
+            count += 1
+        else:
+            stream.write("]")
+    stream.write("]\n")
+    return count
+
+
+def _decode_cbor(buf: bytes, pos: int) -> tuple[object, int]:
+    """
+    Decode the CBOR value at the offset, returning it along with the offset after it
+
+    This only supports the types used by ncdu (no tags or floats).
+    Text strings are decoded like file names, with `surrogateescape`.
+    """
+    try:
+        initial = buf[pos]
+    except IndexError:
+        raise NcduFormatError("Truncated CBOR value") from None
+    major, info = initial >> 5, initial & 0x1F
+    pos += 1
+    if info < 24:
+        arg: Optional[int] = info
+    elif info <= 27:
+        size = 1 << (info - 24)
+        arg = int.from_bytes(buf[pos : pos + size], "big")
+        pos += size
+    elif info == 31 and major in (2, 3, 4, 5):
+        # indefinite length, terminated by a break (0xff)
+        arg = None
+    else:
+        raise NcduFormatError(f"Unsupported CBOR value: {initial:#x}")
+    if major == 0:
+        return arg, pos
+    elif major == 1:
+        return -1 - arg, pos
+    elif major in (2, 3):
+        if arg is None:
+            chunks = []
+            while buf[pos] != 0xFF:
+                chunk, pos = _decode_cbor(buf, pos)
+                chunks.append(chunk)
+            value = b"".join(os.fsencode(chunk) for chunk in chunks)
+            pos += 1
+        else:
+            value = buf[pos : pos + arg]
+            pos += arg
+        return (value.decode("utf-8", "surrogateescape") if major == 3 else value), pos
+    elif major == 4:
+        items = []
+        while (len(items) < arg) if arg is not None else (buf[pos] != 0xFF):
+            item, pos = _decode_cbor(buf, pos)
+            items.append(item)
+        return items, pos + (1 if arg is None else 0)
+    elif major == 5:
+        mapping = {}
+        while (len(mapping) < arg) if arg is not None else (buf[pos] != 0xFF):
+            key, pos = _decode_cbor(buf, pos)
+            mapping[key], pos = _decode_cbor(buf, pos)
+        return mapping, pos + (1 if arg is None else 0)
+    elif major == 7 and info in (20, 21, 22):
+        return (False, True, None)[info - 20], pos
+    else:
+        raise NcduFormatError(f"Unsupported CBOR value: {initial:#x}")
+
+
+class NcduBinaryReader:
+    """
+    Reads the binary export format of ncdu 2.6+, yielding the same events as `NcduReader`
+
+    The file is a signature followed by blocks, each framed by a header and footer
+    holding the type in the top 4 bits and the total length in the rest.
+    Data blocks hold their number and a zstd-compressed sequence of CBOR items.
+    The final index block holds the offset and length of every data block, then a reference to the root.
+
+    Each item is a map with integer keys, and items refer to each other by `(block number << 24) | offset`.
+    A directory refers to its last child, and each item to its previous sibling.
+    Items are written after their children, so walking the tree from the root (at the end of the file)
+    visits the blocks in roughly descending order.
+    The file is memory mapped, and blocks are decompressed on demand by a pool of threads,
+    which also prefetches the blocks before them.
+    Only a bounded number of decompressed blocks are kept.
+
+    The file is far smaller than a JSON export, but slower to read (about 1.4x),
+    since the items are decoded in Python instead of by the C scanner of `json`.
+
+    Format: https://dev.yorhel.nl/ncdu/binfmt
+    """
+
+    SIGNATURE = b"\xbfncduEX1"
+    CACHE_SIZE = 64
+    """The number of decompressed blocks to keep, including those being prefetched"""
+    EXCLUDED_TYPES = {-2: "pattern", -3: "otherfs", -4: "kernfs"}
+    """The negative item types, besides -1 (an error reading the item)"""
+
+    jobs: int
+    root: int
+    """The reference to the root item"""
+
+    def __init__(self, stream: BinaryIO, *, jobs: int):
+        self.jobs = jobs
+        self._mmap = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self._mmap[: len(self.SIGNATURE)] != self.SIGNATURE:
+                raise NcduFormatError("Missing the signature of a binary export")
+            (footer,) = struct.unpack_from(">I", self._mmap, len(self._mmap) - 4)
+            length = footer & 0x0FFF_FFFF
+            if footer >> 28 != 1 or length < 16 or length > len(self._mmap) - len(self.SIGNATURE):
+                raise NcduFormatError("Missing the index block")
+            index = self._mmap[len(self._mmap) - length + 4 : len(self._mmap) - 4]
+            self._pointers = struct.unpack(f">{len(index) // 8}Q", index)
+            self.root = self._pointers[-1]
+            self._pointers = self._pointers[:-1]
+        except BaseException:
+            self._mmap.close()
+            raise
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._blocks: OrderedDict[int, Future] = OrderedDict()
+        # consecutive items are usually in the same block
+        self._last_block: tuple[int, bytes] = (-1, b"")
+
+    def _decompress(self, number: int) -> bytes:
+        try:
+            pointer = self._pointers[number]
+        except IndexError:
+            raise NcduFormatError(f"Missing data block {number}") from None
+        offset, length = pointer >> 24, pointer & 0xFF_FFFF
+        header, block_number = struct.unpack_from(">II", self._mmap, offset)
+        if header != length or block_number != number:
+            raise NcduFormatError(f"Invalid data block {number}")
+        return zstd_decompress(self._mmap[offset + 8 : offset + length - 4])
+
+    def _block(self, number: int) -> bytes:
+        blocks = self._blocks
+        try:
+            future = blocks[number]
+            blocks.move_to_end(number)
+        except KeyError:
+            future = blocks[number] = self._pool.submit(self._decompress, number)
+        # prefetch the blocks which are (probably) visited next
+        for prefetch in range(number - 1, max(number - 1 - 2 * self.jobs, -1), -1):
+            if prefetch not in blocks:
+                blocks[prefetch] = self._pool.submit(self._decompress, prefetch)
+        while len(blocks) > self.CACHE_SIZE:
+            blocks.popitem(last=False)
+        data = future.result()
+        self._last_block = (number, data)
+        return data
+
+    def _read(self, ref: int) -> tuple[dict, int, Optional[int], Optional[int]]:
+        """
+        Read the item at the reference, returning its info object (as in the JSON format),
+        its type, and the references to its previous sibling and last child
+
+        Decoding items is the bottleneck of reading a binary export, so this has a fast path for what ncdu writes
+        (an indefinite length map with small integer keys, starting with the type and name),
+        which decodes the fields into locals instead of an intermediate map.
+        """
+        number = ref >> 24
+        if number == self._last_block[0]:
+            buf = self._last_block[1]
+        else:
+            buf = self._block(number)
+        pos = ref & 0xFF_FFFF
+        item_type = name = prev = child = asize = dsize = None
+        # the other fields, which most items lack
+        rest: dict = {}
+        try:
+            if buf[pos] != 0xBF:
+                rest, _end = _decode_cbor(buf, pos)
+                if not isinstance(rest, dict):
+                    raise NcduFormatError("Expected a CBOR map")
+                item_type, name, prev, asize, dsize, child = (rest.pop(key, None) for key in (0, 1, 2, 3, 4, 12))
+            else:
+                initial = buf[pos + 2]
+                if buf[pos + 1] == 0 and (initial < 24 or 0x20 <= initial < 0x38):
+                    # a small (possibly negative) type, then usually a short name
+                    item_type = initial if initial < 24 else 0x1F - initial
+                    initial = buf[pos + 4]
+                    if buf[pos + 3] == 1 and 0x40 <= initial <= 0x58:
+                        if initial == 0x58:
+                            end = pos + 6 + buf[pos + 5]
+                            name = buf[pos + 6 : end]
+                        else:
+                            end = pos + 5 + (initial - 0x40)
+                            name = buf[pos + 5 : end]
+                        pos = end
+                    else:
+                        pos += 3
+                else:
+                    pos += 1
+                while (key := buf[pos]) != 0xFF:
+                    initial = buf[pos + 1]
+                    if key >= 24:
+                        key, pos = _decode_cbor(buf, pos)
+                        value, pos = _decode_cbor(buf, pos)
+                    elif initial < 24:
+                        value = initial
+                        pos += 2
+                    elif initial < 28:
+                        end = pos + 2 + (1 << (initial - 24))
+                        value = int.from_bytes(buf[pos + 2 : end], "big")
+                        pos = end
+                    elif 0x40 <= initial < 0x58:
+                        end = pos + 2 + (initial - 0x40)
+                        value = buf[pos + 2 : end]
+                        pos = end
+                    else:
+                        value, pos = _decode_cbor(buf, pos + 1)
+                    match key:
+                        case 0:
+                            item_type = value
+                        case 1:
+                            name = value
+                        case 2:
+                            prev = value
+                        case 3:
+                            asize = value
+                        case 4:
+                            dsize = value
+                        case 12:
+                            child = value
+                        case _:
+                            rest[key] = value
+        except IndexError:
+            raise NcduFormatError("Truncated CBOR value") from None
+        if not isinstance(item_type, int) or name is None:
+            raise NcduFormatError(f"Invalid item: {ref:#x}")
+        info: dict = {"name": name.decode("utf-8", "surrogateescape") if isinstance(name, bytes) else name}
+        if item_type < 0:
+            if item_type == -1:
+                info["read_error"] = True
+            else:
+                info["excluded"] = self.EXCLUDED_TYPES.get(item_type, "pattern")
+            return info, item_type, prev, None
+        if asize is not None:
+            info["asize"] = asize
+        if dsize is not None:
+            info["dsize"] = dsize
+        match item_type:
+            case 0:
+                if 5 in rest:
+                    info["dev"] = rest[5]
+                if rest.get(6) is True:
+                    info["read_error"] = True
+            case 2:
+                info["notreg"] = True
+            case 3:
+                info["hlnkc"] = True
+                info["ino"] = rest.get(13)
+                info["nlink"] = rest.get(14, 1)
+        return info, item_type, prev, child
+
+    def events(self) -> Iterator[tuple[NcduEvent, Optional[dict]]]:
+        self._pool = ThreadPoolExecutor(self.jobs, thread_name_prefix="ncdu-block")
+        try:
+            info, _type, _prev, child = self._read(self.root)
+            yield NcduEvent.OPEN_DIR, info
+            # the next child to visit in each open directory
+            stack = [child]
+            while stack:
+                if (ref := stack[-1]) is None:
+                    stack.pop()
+                    yield NcduEvent.CLOSE_DIR, None
+                    continue
+                info, item_type, stack[-1], child = self._read(ref)
+                if item_type == 0:
+                    yield NcduEvent.OPEN_DIR, info
+                    stack.append(child)
+                else:
+                    yield NcduEvent.ENTRY, info
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._blocks.clear()
+            self._last_block = (-1, b"")
+
+    def close(self):
+        self._mmap.close()
+
+
+@contextmanager
+def read_export(path: Path, *, jobs: int = 1) -> Iterator[Iterator[tuple[NcduEvent, Optional[dict]]]]:
+    """Read the events of an export, detecting whether it's in the JSON or binary format"""
+    with open(path, "rb") as f:
+        if f.read(len(NcduBinaryReader.SIGNATURE)) == NcduBinaryReader.SIGNATURE:
+            if zstd_decompress is None:
+                raise click.ClickException(
+                    "Reading binary exports requires Python 3.14+ or the zstandard package\n"
+                    "  Please install using `pip install --user zstandard`"
+                )
+            reader = NcduBinaryReader(f, jobs=jobs)
+            try:
+                yield reader.events()
+            finally:
+                reader.close()
+        else:
+            f.seek(0)
+            yield NcduReader(io.TextIOWrapper(f)).events()
+
+
+class DirStore:
+    """
+    Every directory seen so far, as parallel arrays indexed by directory number
+
+    Paths are stored as the index of the parent plus the (interned) name,
+    and are only joined into strings when they are written.
+    The prefixes of the open directories are cached,
+    since every entry being written is inside one of them.
+    """
+
+    __slots__ = ("parents", "names", "devs", "_open_prefixes")
+
+    parents: array
+    """The index of the parent of each directory, or -1 for the root"""
+    names: list[str]
+    devs: array
+    """The device of each directory, which ncdu only writes when it differs from the parent"""
+    _open_prefixes: dict[int, str]
+
+    def __init__(self):
+        self.parents = array("q")
+        self.names = []
+        self.devs = array("Q")
+        self._open_prefixes = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, parent: int, name: str, dev: Optional[int] = None) -> int:
+        self.parents.append(parent)
+        self.names.append(sys.intern(name))
+        if dev is None:
+            dev = self.devs[parent] if parent >= 0 else 0
+        self.devs.append(dev)
+        return len(self.names) - 1
+
+    def open(self, index: int):
+        self._open_prefixes[index] = self.prefix(index)
+
+    def close(self, index: int):
+        del self._open_prefixes[index]
+
+    def prefix(self, index: int) -> str:
+        """The path of the directory, including a trailing separator"""
+        try:
+            return self._open_prefixes[index]
+        except KeyError:
+            pass
+        parent, name = self.parents[index], self.names[index]
+        if parent >= 0:
+            return f"{self.prefix(parent)}{name}/"
+        elif name == ".":
+            # matches `Path(".") / name`
+            return ""
+        else:
+            return name if name.endswith("/") else f"{name}/"
+
+    def join(self, parent: int, name: str) -> str:
+        if parent >= 0:
+            return self.prefix(parent) + name
+        else:
+            # the root
+            return name.rstrip("/") or "/"
+
+    def path(self, index: int) -> str:
+        return self.join(self.parents[index], self.names[index])
+
+
+class InodeSet:
+    """
+    A set of `(dev, ino)` pairs, using open addressing in a flat array
+
+    Each pair is packed into a single 64-bit key, with a small index for the device in the top byte.
+    That takes 8 bytes per slot (and the table is at most 3/4 full),
+    instead of the ~120 bytes for each tuple in a `set`,
+    which matters for trees with millions of hardlinks.
+    Inodes too large to pack fall back to a regular set.
+    """
+
+    __slots__ = ("_keys", "_shift", "_len", "_devices", "_overflow")
+
+    _keys: array
+    """The packed key plus one for each slot, with zero marking an empty slot"""
+    _shift: int
+    _len: int
+    _devices: dict[int, int]
+    _overflow: set[tuple[int, int]]
+
+    _MULTIPLIER = 0x9E3779B97F4A7C15
+    _MASK = (1 << 64) - 1
+    _INODE_BITS = 56
+
+    def __init__(self, *, bits: int = 10):
+        self._keys = array("Q", bytes(8 << bits))
+        self._shift = 64 - bits
+        self._len = 0
+        self._devices = {}
+        self._overflow = set()
+
+    def __len__(self) -> int:
+        return self._len + len(self._overflow)
+
+    def add(self, dev: int, ino: int) -> bool:
+        """Add the pair, returning False if it was already present"""
+        try:
+            device_index = self._devices[dev]
+        except KeyError:
+            device_index = self._devices[dev] = len(self._devices)
+        if ino >> self._INODE_BITS or device_index >= 255:
+            if (dev, ino) in self._overflow:
+                return False
+            self._overflow.add((dev, ino))
+            return True
+        key = ((device_index << self._INODE_BITS) | ino) + 1
+        keys = self._keys
+        mask = len(keys) - 1
+        # fibonacci hashing, using the high bits of the product
+        slot = ((key * self._MULTIPLIER) & self._MASK) >> self._shift
+        while True:
+            existing = keys[slot]
+            if existing == key:
+                return False
+            elif not existing:
+                break
+            slot = (slot + 1) & mask
+        keys[slot] = key
+        self._len += 1
+        if 4 * self._len > 3 * len(keys):
+            self._grow()
+        return True
+
+    def _grow(self):
+        old_keys = self._keys
+        keys = self._keys = array("Q", bytes(16 * len(old_keys)))
+        self._shift -= 1
+        mask = len(keys) - 1
+        for key in old_keys:
+            if key:
+                slot = ((key * self._MULTIPLIER) & self._MASK) >> self._shift
+                while keys[slot]:
+                    slot = (slot + 1) & mask
+                keys[slot] = key
+
+
 class EntryField(Enum):
-    PATH = "full_path"
+    PATH = "path"
     SIZE = "size_or_type"
 
-    @property
-    def field_name(self) -> str:
-        return self.value
+    def format(self, entry: Entry, dirs: DirStore) -> str:
+        if self is EntryField.PATH:
+            return dirs.join(entry.parent, entry.name)
+        else:
+            return str(entry.size_or_type)
 
     def __str__(self) -> str:
         return self.name.lower()
 
 
+@dataclass(slots=True)
+class Filters:
+    """
+    Filters on the raw info objects, evaluated by the parser before any `Entry` is built
+
+    Excluded directories (and directories deeper than `max_depth`) are skipped along with everything inside them,
+    without adding anything to the `DirStore`.
+    Directories which only fail the other filters are still descended into, since their children might match.
+    """
+
+    min_size: Optional[int] = None
+    """Entries without a size (including directories) never match"""
+    size_key: str = "asize"
+    max_depth: Optional[int] = None
+    """The deepest entries to include, where the root is at depth zero"""
+    match_name: Optional[Callable[[str], object]] = None
+    types: Optional[frozenset[FileType]] = None
+    exclude: Optional[Callable[[str], object]] = None
+    """Matches the names of the entries to skip, along with their contents"""
+
+    @staticmethod
+    def file_type(data: dict, *, is_dir: bool) -> FileType:
+        if data.get("notreg"):
+            return FileType.OTHER
+        return FileType.DIR if is_dir else FileType.FILE
+
+    def prune(self, data: dict, depth: int) -> bool:
+        """Whether to skip a directory and all of its contents"""
+        if self.max_depth is not None and depth > self.max_depth:
+            return True
+        return self.exclude is not None and bool(self.exclude(data["name"]))
+
+    def matches(self, data: dict, depth: int, *, is_dir: bool) -> bool:
+        """Whether to write an entry (assuming it wasn't pruned)"""
+        if not is_dir and self.prune(data, depth):
+            return False
+        if self.types is not None and self.file_type(data, is_dir=is_dir) not in self.types:
+            return False
+        if self.min_size is not None and (is_dir or int(data.get(self.size_key, 0)) < self.min_size):
+            return False
+        return self.match_name is None or bool(self.match_name(data["name"]))
+
+
 class Output(metaclass=ABCMeta):
     stream: io.IOBase
+    filters: Optional[Filters]
+    """Pushed down into `handle_events`, so skipped entries and subtrees are never materialized"""
     entry_filter: Callable[[Entry], bool]
+    """Called for every entry which passes the `filters`, after it is built"""
+    size_key: str
+    """The field used for `Entry.size`, either the apparent size (asize) or the disk usage (dsize)"""
+    hardlinks: Optional[InodeSet]
+    """If present, only the first link to each hardlinked inode keeps its size"""
+    dirs: DirStore
+
+    EXCLUDED_DIR = -2
+    """Marks an excluded directory on the stack, whose contents are skipped"""
+    WRITE_ALL_DIRS = False
+    """Write directories even if they fail the filters (but not if they are pruned), so the tree stays connected"""
 
     def __init__(self, stream):
         self.stream = stream
+        self.filters = None
         self.entry_filter = lambda _: True
+        self.size_key = "asize"
+        self.hardlinks = None
+        self.dirs = DirStore()
 
-    def handle_raw_entry(self, parent: Path, data, *, is_dir: bool) -> Path:
-        if isinstance(data, list):
-            assert is_dir, "List should correspond to a directory"
-            data_iter = iter(data)
-            raw_root = next(data_iter)
-            if "excluded" in raw_root:
-                return
-            assert isinstance(raw_root, dict), repr(raw_root)
-            root_path = self.handle_raw_entry(parent, raw_root, is_dir=True)
-            for child_data in data_iter:
-                self.handle_raw_entry(root_path, child_data, is_dir=isinstance(child_data, list))
-            return root_path
-        elif isinstance(data, dict):
-            # format: https://dev.yorhel.nl/ncdu/jsonfmt
-            if "excluded" in data:
-                return
-            name = data["name"]
-            if data.get("notreg"):
-                file_type = FileType.OTHER
-                size = data.get("asize")
-                if size is not None:
-                    size = int(size)
-            elif is_dir:
-                file_type = FileType.DIR
-                size = None
+    def handle_events(self, events: Iterator[tuple[NcduEvent, Optional[dict]]]) -> Optional[str]:
+        """Write the entries from the events as they are read, returning the path of the root"""
+        dirs = self.dirs
+        filters = self.filters
+        hardlinks = self.hardlinks
+        # The indexes of the open directories, whose length is the depth of their children
+        dir_stack: list[int] = []
+        for event, data in events:
+            # ordered by frequency
+            if event is NcduEvent.ENTRY:
+                parent = dir_stack[-1]
+                if (
+                    parent != self.EXCLUDED_DIR
+                    and "excluded" not in data
+                    and (filters is None or filters.matches(data, len(dir_stack), is_dir=False))
+                ):
+                    entry = self.parse_entry(parent, data, is_dir=False)
+                    if hardlinks is not None and (data.get("hlnkc") or data.get("nlink", 1) > 1):
+                        self.dedup_hardlink(entry)
+                    self.write_entry(entry)
+            elif event is NcduEvent.OPEN_DIR:
+                parent = dir_stack[-1] if dir_stack else -1
+                depth = len(dir_stack)
+                if (
+                    parent == self.EXCLUDED_DIR
+                    or "excluded" in data
+                    or (filters is not None and filters.prune(data, depth))
+                ):
+                    dir_stack.append(self.EXCLUDED_DIR)
+                    continue
+                index = dirs.add(parent, data["name"], data.get("dev"))
+                dirs.open(index)
+                dir_stack.append(index)
+                if self.WRITE_ALL_DIRS or filters is None or filters.matches(data, depth, is_dir=True):
+                    self.write_entry(self.parse_entry(parent, data, is_dir=True))
+                self.open_dir(index, data)
             else:
-                file_type = FileType.FILE
-                try:
-                    size = int(data["asize"])
-                except KeyError:
-                    size = 0
-            full_path = parent / name
-            self.write_entry(
-                Entry(
-                    full_path=full_path,
-                    file_type=file_type,
-                    size=size,
-                )
-            )
-            return full_path
+                index = dir_stack.pop()
+                if index != self.EXCLUDED_DIR:
+                    self.close_dir(index)
+                    dirs.close(index)
+        self.finish()
+        return dirs.path(0) if dirs else None
+
+    def parse_entry(self, parent: int, data: dict, *, is_dir: bool) -> Entry:
+        # format: https://dev.yorhel.nl/ncdu/jsonfmt
+        if data.get("notreg"):
+            file_type = FileType.OTHER
+            size = data.get(self.size_key)
+            if size is not None:
+                size = int(size)
+        elif is_dir:
+            file_type = FileType.DIR
+            size = None
+        else:
+            file_type = FileType.FILE
+            try:
+                size = int(data[self.size_key])
+            except KeyError:
+                size = 0
+        if is_dir:
+            disk_size = None
         else:
-            raise TypeError(type(data))
+            disk_size = data.get("dsize")
+            if disk_size is not None:
+                disk_size = int(disk_size)
+            elif file_type is FileType.FILE:
+                disk_size = 0
+        return Entry(
+            parent=parent,
+            name=data["name"],
+            file_type=file_type,
+            size=size,
+            disk_size=disk_size,
+            ino=data.get("ino"),
+            dev=data.get("dev"),
+        )
+
+    def dedup_hardlink(self, entry: Entry):
+        """Zero the sizes of a hardlink if its inode was already counted"""
+        if entry.ino is None:
+            return
+        dev = entry.dev if entry.dev is not None else self.dirs.devs[entry.parent]
+        if not self.hardlinks.add(dev, entry.ino):
+            entry.size = 0 if entry.size is not None else None
+            entry.disk_size = 0 if entry.disk_size is not None else None
 
     @abstractmethod
     def write_entry(self, entry: Entry):
         pass
 
+    def open_dir(self, index: int, data: dict):
+        """
+        Called after writing the entry of a directory, before any of its children
+
+        This is called even if the directory failed the filters, with its raw info.
+        """
+
+    def close_dir(self, index: int):
+        """Called after all the children of a directory"""
+
+    def finish(self):
+        """Called after all the entries have been handled"""
+
     def close(self):
         self.stream.close()
 
@@ -114,10 +990,11 @@ class PlainOutput(Output):
     def write_entry(self, entry: Entry):
         if not self.entry_filter(entry):
             return
-        res = [str(entry.full_path)]
+        path = self.dirs.join(entry.parent, entry.name)
         if self.value_field is not None:
-            res.append(str(getattr(entry, self.value_field.field_name)))
-        self.stream.write(" ".join(res) + "\n")
+            self.stream.write(f"{path} {self.value_field.format(entry, self.dirs)}\n")
+        else:
+            self.stream.write(f"{path}\n")
 
 
 class CSVOutput(Output):
@@ -134,40 +1011,671 @@ class CSVOutput(Output):
     def write_entry(self, entry: Entry):
         if not self.entry_filter(entry):
             return
-        self.writer.writerow([str(getattr(entry, field.field_name)) for field in self.fields])
+        self.writer.writerow([field.format(entry, self.dirs) for field in self.fields])
+
+
+class JSONOutput(Output):
+    """Writes each entry as a line of JSON"""
+
+    include_sizes: bool
+
+    def __init__(self, stream, include_sizes: bool):
+        super(JSONOutput, self).__init__(stream)
+        self.include_sizes = include_sizes
+
+    def write_entry(self, entry: Entry):
+        if not self.entry_filter(entry):
+            return
+        data = {"path": self.dirs.join(entry.parent, entry.name)}
+        if self.include_sizes:
+            data["type"] = str(entry.file_type)
+            data["size"] = entry.size
+        self.stream.write(json.dumps(data) + "\n")
+
+
+class SQLiteOutput(Output):
+    """
+    Bulk-loads the entries into an SQLite database, as a tree of parent ids
+
+    Everything is inserted by batches of `executemany` in a single transaction,
+    with journaling and syncing disabled (a failed load just leaves a useless database).
+    The indexes are only created at the end, which is much faster than updating them on every insert.
+
+    Directories have no size of their own, so the size of a directory is the sum over its descendants:
+        WITH RECURSIVE tree(id) AS (
+            SELECT id FROM entries WHERE parent IS NULL
+            UNION ALL SELECT entries.id FROM entries JOIN tree ON entries.parent = tree.id
+        ) SELECT sum(asize) FROM entries JOIN tree USING (id);
+
+    The filters only apply to files, since every entry needs its parent directory.
+    Pruned directories (like those matching `--exclude`) are still skipped along with their contents.
+    """
+
+    WRITE_ALL_DIRS = True
+
+    BATCH_SIZE = 100_000
+    SCHEMA = """
+        DROP TABLE IF EXISTS entries;
+        CREATE TABLE entries (
+            id INTEGER PRIMARY KEY,
+            parent INTEGER REFERENCES entries (id),
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            asize INTEGER,
+            dsize INTEGER,
+            ino INTEGER,
+            dev INTEGER NOT NULL
+        );
+    """
+    INDEXES = """
+        CREATE INDEX entries_parent ON entries (parent);
+        CREATE INDEX entries_asize ON entries (asize);
+        CREATE INDEX entries_dsize ON entries (dsize);
+    """
+
+    connection: sqlite3.Connection
+    count: int
+    _batch: list[tuple]
+    _dir_ids: array
+    """The id of each directory in the `DirStore`"""
+    _pending_dir_id: int
+
+    def __init__(self, path: Path):
+        super(SQLiteOutput, self).__init__(None)
+        # autocommit is off by default, so everything is in one transaction until `finish`
+        self.connection = sqlite3.connect(path)
+        for pragma in (
+            "journal_mode = OFF",
+            "synchronous = OFF",
+            "locking_mode = EXCLUSIVE",
+            "temp_store = MEMORY",
+            "cache_size = -262144",
+        ):
+            self.connection.execute(f"PRAGMA {pragma}")
+        self.connection.executescript(self.SCHEMA)
+        self.count = 0
+        self._batch = []
+        self._dir_ids = array("q")
+        self._pending_dir_id = -1
+
+    def write_entry(self, entry: Entry):
+        if not self.entry_filter(entry):
+            return
+        # ids start at one, like an implicit rowid
+        self.count += 1
+        entry_id = self.count
+        if entry.parent >= 0:
+            parent_id = self._dir_ids[entry.parent]
+            dev = entry.dev if entry.dev is not None else self.dirs.devs[entry.parent]
+        else:
+            parent_id = -1
+            dev = entry.dev or 0
+        if entry.file_type is FileType.DIR:
+            self._pending_dir_id = entry_id
+        self._batch.append(
+            (
+                entry_id,
+                parent_id if parent_id >= 0 else None,
+                entry.name,
+                str(entry.file_type),
+                entry.size,
+                entry.disk_size,
+                entry.ino,
+                dev,
+            )
+        )
+        if len(self._batch) >= self.BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        self.connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._batch)
+        self._batch.clear()
+
+    def open_dir(self, index: int, data: dict):
+        self._dir_ids.append(self._pending_dir_id)
+        self._pending_dir_id = -1
+
+    def finish(self):
+        self._flush()
+        self.connection.commit()
+        self.connection.executescript(self.INDEXES)
+        self.connection.execute("ANALYZE")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class ReportOutput(Output):
+    """
+    Aggregates the entries into reports, in the same streaming pass
+
+    Directory rollups are written as each directory is closed (and its recursive size becomes known),
+    and everything else is written at the end.
+    Memory use stays bounded: the top-N reports use heaps of size N,
+    and the rollups only need a running total for each open directory.
+
+    Each report row has a name (a path or extension), a total size, and a count of entries.
+    """
+
+    top: Optional[int]
+    by_extension: bool
+    rollup_depth: Optional[int]
+    """If present, write rollups for every directory up to this depth (where the root is at depth zero)"""
+    output_format: str
+
+    _totals: list[list[int]]
+    """The recursive size (including the directories themselves) and entry count of each open directory"""
+    _top_files: list[tuple[int, int, str]]
+    """A min-heap of `(size, parent, name)`"""
+    _top_dirs: list[tuple[int, int, int]]
+    """A min-heap of `(size, index, count)`"""
+    _extensions: dict[str, list[int]]
+
+    def __init__(
+        self, stream, output_format: str, *, top: Optional[int], by_extension: bool, rollup_depth: Optional[int]
+    ):
+        super(ReportOutput, self).__init__(stream)
+        self.output_format = output_format
+        self.top = top
+        self.by_extension = by_extension
+        self.rollup_depth = rollup_depth
+        self._totals = []
+        self._top_files = []
+        self._top_dirs = []
+        self._extensions = {}
+        self._current_report = None
+        if output_format == "csv":
+            self._csv = csv.writer(stream)
+            self._csv.writerow(["report", "name", "size", "count"])
+
+    def write_row(self, report: str, name: str, size: int, count: int):
+        match self.output_format:
+            case "plain":
+                if report != self._current_report:
+                    self.stream.write(f"# {report}\n")
+                    self._current_report = report
+                self.stream.write(f"{size} {count} {name}\n")
+            case "csv":
+                self._csv.writerow([report, name, size, count])
+            case "json":
+                self.stream.write(json.dumps({"report": report, "name": name, "size": size, "count": count}) + "\n")
+            case _:
+                raise AssertionError(self.output_format)
+
+    @staticmethod
+    def _push_top(heap: list, limit: int, item: tuple):
+        if len(heap) < limit:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    def write_entry(self, entry: Entry):
+        if not self.entry_filter(entry):
+            return
+        if entry.file_type is FileType.DIR:
+            return
+        size = entry.size or 0
+        totals = self._totals[-1]
+        totals[0] += size
+        totals[1] += 1
+        if self.top:
+            self._push_top(self._top_files, self.top, (size, entry.parent, entry.name))
+        if self.by_extension:
+            extension = os.path.splitext(entry.name)[1].lower()
+            try:
+                stats = self._extensions[extension]
+            except KeyError:
+                stats = self._extensions[extension] = [0, 0]
+            stats[0] += size
+            stats[1] += 1
+
+    def open_dir(self, index: int, data: dict):
+        # counted like `du`, which includes the size of each directory (even one which fails the filters)
+        self._totals.append([int(data.get(self.size_key, 0)), 0])
+
+    def close_dir(self, index: int):
+        size, count = self._totals.pop()
+        depth = len(self._totals)
+        if self._totals:
+            parent_totals = self._totals[-1]
+            parent_totals[0] += size
+            # includes the directory itself
+            parent_totals[1] += count + 1
+        if self.top:
+            self._push_top(self._top_dirs, self.top, (size, index, count))
+        if self.rollup_depth is not None and depth <= self.rollup_depth:
+            self.write_row("rollup", self.dirs.path(index), size, count)
+
+    def finish(self):
+        if self.top:
+            for size, parent, name in sorted(self._top_files, reverse=True):
+                self.write_row("top-files", self.dirs.join(parent, name), size, 1)
+            for size, index, count in sorted(self._top_dirs, reverse=True):
+                self.write_row("top-dirs", self.dirs.path(index), size, count)
+        if self.by_extension:
+            by_size = sorted(self._extensions.items(), key=lambda item: item[1][0], reverse=True)
+            for extension, (size, count) in by_size:
+                self.write_row("extensions", extension or "(none)", size, count)
+
+
+class SortedEntries(Output):
+    """
+    Collects the entries of an export in path order, using an external merge sort
+
+    Entries are sorted in chunks, which are spilled to temporary files and then lazily merged,
+    so memory use is bounded by the chunk size instead of the size of the export.
+
+    Paths are relative to the root (which is the empty string),
+    so exports with different roots can be compared.
+    They are compared component-wise (see `sort_key`),
+    so every directory comes immediately before its descendants.
+
+    Each spilled record is `<type><size> <path>` terminated by a null character,
+    since paths can contain any other character (including newlines).
+    The size of a directory is its own size (not its recursive size), so `DiffOutput` counts it like `ReportOutput`.
+    """
+
+    DEFAULT_CHUNK_SIZE = 1_000_000
+
+    chunk_size: int
+    _chunk: list[tuple[str, str, int]]
+    _spills: list[TextIO]
+
+    def __init__(self, *, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super(SortedEntries, self).__init__(stream=None)
+        self.chunk_size = chunk_size
+        self._chunk = []
+        self._spills = []
+
+    @staticmethod
+    def sort_key(record: tuple[str, str, int]) -> str:
+        # The null character sorts before anything else, and can't appear in a name
+        return record[0].replace("/", "\0")
+
+    def parse_entry(self, parent: int, data: dict, *, is_dir: bool) -> Entry:
+        entry = super(SortedEntries, self).parse_entry(parent, data, is_dir=is_dir)
+        if is_dir:
+            entry.size = int(data.get(self.size_key, 0))
+        return entry
+
+    def write_entry(self, entry: Entry):
+        if not self.entry_filter(entry):
+            return
+        if entry.parent < 0:
+            path = ""
+        else:
+            path = self.dirs.join(entry.parent, entry.name)[len(self.dirs.prefix(0)) :]
+        self._chunk.append((path, entry.file_type.value[0], entry.size or 0))
+        if len(self._chunk) >= self.chunk_size:
+            self._spill()
+
+    def _spill(self):
+        self._chunk.sort(key=self.sort_key)
+        spill = tempfile.TemporaryFile("w+t", encoding="utf-8", errors="surrogatepass", newline="")
+        spill.writelines(f"{file_type}{size} {path}\0" for path, file_type, size in self._chunk)
+        self._spills.append(spill)
+        self._chunk.clear()
+
+    @staticmethod
+    def _read_spill(spill: TextIO) -> Iterator[tuple[str, str, int]]:
+        spill.seek(0)
+        leftover = ""
+        while chunk := spill.read(1 << 20):
+            records = (leftover + chunk).split("\0")
+            leftover = records.pop()
+            for record in records:
+                meta, _, path = record.partition(" ")
+                yield path, meta[0], int(meta[1:])
+
+    def __iter__(self) -> Iterator[tuple[str, str, int]]:
+        """Iterate over the sorted `(path, type, size)` records, where the type is the first letter of the `FileType`"""
+        if not self._spills:
+            # everything fit in a single chunk
+            self._chunk.sort(key=self.sort_key)
+            return iter(self._chunk)
+        if self._chunk:
+            self._spill()
+        return heapq.merge(*map(self._read_spill, self._spills), key=self.sort_key)
+
+    def close(self):
+        for spill in self._spills:
+            spill.close()
+        self._spills.clear()
+
 
+class DiffOutput:
+    """
+    Writes the differences between two sorted exports, found by merge-joining them
 
-@click.command()
+    Also rolls up the growth of each directory, with a stack of the directories containing the current path.
+    This works in a single pass because `SortedEntries` puts every directory right before its descendants.
+    Like `ReportOutput`, the rollups include the size of each directory itself,
+    but only files are reported as individual entries which grew or shrank.
+    """
+
+    stream: io.IOBase
+    output_format: str
+    rollup_depth: Optional[int]
+    entries: bool
+    """Write the individual entries, not just the directory rollups"""
+
+    def __init__(self, stream, output_format: str, *, rollup_depth: Optional[int], entries: bool):
+        self.stream = stream
+        self.output_format = output_format
+        self.rollup_depth = rollup_depth
+        self.entries = entries
+        # The (prefix, path, old size, new size) of the directories containing the current path
+        self._dir_stack: list[list] = []
+        if output_format == "csv":
+            self._csv = csv.writer(stream)
+            self._csv.writerow(["change", "path", "old_size", "new_size", "delta"])
+
+    def write_row(self, change: str, path: str, old_size: int, new_size: int):
+        path = path or "."
+        delta = new_size - old_size
+        match self.output_format:
+            case "plain":
+                self.stream.write(f"{change} {delta:+} {path}\n")
+            case "csv":
+                self._csv.writerow([change, path, old_size, new_size, delta])
+            case "json":
+                data = {"change": change, "path": path, "old_size": old_size, "new_size": new_size, "delta": delta}
+                self.stream.write(json.dumps(data) + "\n")
+            case _:
+                raise AssertionError(self.output_format)
+
+    def _pop_dir(self):
+        _prefix, path, old_size, new_size = self._dir_stack.pop()
+        if self._dir_stack:
+            parent = self._dir_stack[-1]
+            parent[2] += old_size
+            parent[3] += new_size
+        depth = path.count("/") + 1 if path else 0
+        if old_size != new_size and (self.rollup_depth is None or depth <= self.rollup_depth):
+            self.write_row("dir", path, old_size, new_size)
+
+    def _visit(self, path: str, is_dir: bool, old_size: int, new_size: int):
+        while self._dir_stack and not path.startswith(self._dir_stack[-1][0]):
+            self._pop_dir()
+        if is_dir:
+            self._dir_stack.append([f"{path}/" if path else "", path, old_size, new_size])
+        elif self._dir_stack:
+            parent = self._dir_stack[-1]
+            parent[2] += old_size
+            parent[3] += new_size
+
+    def diff(self, old: Iterable[tuple[str, str, int]], new: Iterable[tuple[str, str, int]]) -> int:
+        """Merge-join the sorted records, returning the number of changed entries"""
+        sort_key = SortedEntries.sort_key
+        old_iter, new_iter = iter(old), iter(new)
+        old_record, new_record = next(old_iter, None), next(new_iter, None)
+        changes = 0
+        while old_record is not None or new_record is not None:
+            if new_record is None or (old_record is not None and sort_key(old_record) < sort_key(new_record)):
+                path, old_type, old_size = old_record
+                self._visit(path, old_type == "d", old_size, 0)
+                if self.entries:
+                    self.write_row("removed", path, old_size, 0)
+                changes += 1
+                old_record = next(old_iter, None)
+            elif old_record is None or sort_key(new_record) < sort_key(old_record):
+                path, new_type, new_size = new_record
+                self._visit(path, new_type == "d", 0, new_size)
+                if self.entries:
+                    self.write_row("added", path, 0, new_size)
+                changes += 1
+                new_record = next(new_iter, None)
+            else:
+                path, old_type, old_size = old_record
+                _path, new_type, new_size = new_record
+                if old_type != new_type:
+                    # replaced by a different type of file, so visit the file before the directory
+                    # (which is still followed by its descendants)
+                    if old_type == "d":
+                        self._visit(path, False, 0, new_size)
+                        self._visit(path, True, old_size, 0)
+                    else:
+                        self._visit(path, False, old_size, 0)
+                        self._visit(path, new_type == "d", 0, new_size)
+                    if self.entries:
+                        self.write_row("removed", path, old_size, 0)
+                        self.write_row("added", path, 0, new_size)
+                    changes += 1
+                else:
+                    self._visit(path, old_type == "d", old_size, new_size)
+                    if old_size != new_size and old_type != "d":
+                        if self.entries:
+                            self.write_row("grown" if new_size > old_size else "shrunk", path, old_size, new_size)
+                        changes += 1
+                old_record, new_record = next(old_iter, None), next(new_iter, None)
+        while self._dir_stack:
+            self._pop_dir()
+        return changes
+
+
+class DefaultCommandGroup(click.Group):
+    """Invokes the `dump` command when no subcommand is given, for compatibility with the original interface"""
+
+    default_command = "dump"
+
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] not in ("--help", "-h"):
+            args.insert(0, self.default_command)
+        return super(DefaultCommandGroup, self).parse_args(ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup)
+def analyse_ncdu():
+    """
+    Analyses the JSON exports of ncdu
+
+    Without a subcommand, this runs `dump`.
+    """
+
+
+def output_file_option(func):
+    return click.option(
+        "output_file",
+        "-o",
+        "--out",
+        type=click.File(mode="wt", lazy=False),
+        help="The output file",
+        default="-",
+    )(func)
+
+
+def output_format_option(*formats: str):
+    return click.option(
+        "output_format",
+        "-f",
+        "--format",
+        default="plain",
+        type=click.Choice(["plain", "csv", "json", *formats]),
+        required=True,
+        help="The output format",
+    )
+
+
+def scan_options(func):
+    func = click.option(
+        "-j",
+        "--jobs",
+        type=click.IntRange(min=1),
+        default=min(8, os.cpu_count() or 1),
+        show_default=True,
+        help="The number of threads listing directories, or decompressing a binary export",
+    )(func)
+    return click.option(
+        "-x",
+        "--one-file-system",
+        is_flag=True,
+        help="Do not descend into directories on other filesystems",
+    )(func)
+
+
+def compile_globs(patterns: Iterable[str]) -> Callable[[str], object]:
+    return re.compile("|".join(map(fnmatch.translate, patterns))).match
+
+
+@analyse_ncdu.command()
+@click.argument("root", type=click.Path(exists=True, file_okay=False))
+@output_file_option
+@scan_options
+@click.option(
+    "--exclude",
+    multiple=True,
+    help="Skip entries whose names match this glob, along with their contents (can be repeated)",
+)
+def scan(root, output_file, jobs, one_file_system, exclude):
+    """
+    Scans a directory, writing an ncdu export
+
+    The export can be read by `ncdu -f`, or by the other commands.
+    To analyse a directory without writing an export, use `dump --scan`.
+    """
+    start = time.perf_counter()
+    scanner = Scanner(
+        root,
+        jobs=jobs,
+        one_file_system=one_file_system,
+        exclude=compile_globs(exclude) if exclude else None,
+    )
+    count = write_export(output_file, scanner.header, scanner.events())
+    elapsed = time.perf_counter() - start
+    print(f"Scanned {count} entries in {scanner.root} ({elapsed:.1f}s)", file=sys.stderr)
+
+
+@analyse_ncdu.command()
 @click.option(
     "input_file",
     "--file",
-    required=True,
     type=click.Path(exists=True, file_okay=True, path_type=Path),
-    help="The input ncdu database to read",
+    help="The input ncdu export to read, in either the JSON or binary format (JSON is faster to read)",
 )
-@click.option("--include-sizes", "--sizes", is_flag=True, help="Include the sizes in the output")
-@click.option("--ignore-dirs", is_flag=True, help="Ignore directories")
 @click.option(
-    "output_format",
-    "-f",
-    "--format",
-    default="plain",
-    type=click.Choice(["plain", "csv"]),
-    required=True,
-    help="The output format",
+    "scan_root",
+    "--scan",
+    type=click.Path(exists=True, file_okay=False),
+    help="Scan this directory instead of reading an export",
 )
+@scan_options
+@click.option("--include-sizes", "--sizes", is_flag=True, help="Include the sizes in the output")
+@click.option("--ignore-dirs", is_flag=True, help="Ignore directories")
+@output_format_option("sqlite")
 @click.option(
-    "output_file",
+    "output_path",
     "-o",
     "--out",
-    type=click.File(mode="wt"),
-    help="The output file",
+    type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+    help="The output file, which must be given for sqlite",
     default="-",
 )
-def analyse_ncdu(input_file, include_sizes, output_format, output_file, ignore_dirs):
-    with open(input_file, "rt") as f:
-        data = json.load(f)
+@click.option(
+    "size_key",
+    "--size",
+    type=click.Choice(["apparent", "disk"]),
+    default="apparent",
+    show_default=True,
+    help="Use the apparent size of each file, or its disk usage",
+    callback=lambda _ctx, _param, value: {"apparent": "asize", "disk": "dsize"}[value],
+)
+@click.option(
+    "--dedup-hardlinks",
+    is_flag=True,
+    help="Only count the size of each hardlinked file once, at its first link",
+)
+@click.option("--min-size", type=click.IntRange(min=0), help="Only include entries with at least this many bytes")
+@click.option(
+    "--max-depth",
+    type=click.IntRange(min=0),
+    help="Skip everything deeper than this, where the root is at depth zero",
+)
+@click.option("--glob", "name_glob", help="Only include entries whose names match this glob")
+@click.option("--regex", "name_regex", help="Only include entries whose names contain a match for this regex")
+@click.option(
+    "file_types",
+    "--type",
+    type=click.Choice([str(file_type) for file_type in FileType]),
+    multiple=True,
+    help="Only include entries of this type (can be repeated)",
+)
+@click.option(
+    "--exclude",
+    multiple=True,
+    help="Skip entries whose names match this glob, along with their contents (can be repeated)",
+)
+@click.option("--top", type=click.IntRange(min=1), help="Report the N largest files and directories")
+@click.option("--by-extension", is_flag=True, help="Report the total size and count of each file extension")
+@click.option(
+    "--rollup",
+    is_flag=True,
+    help="Report the recursive size and entry count of every directory",
+)
+@click.option(
+    "--rollup-depth",
+    type=click.IntRange(min=0),
+    help="Only report rollups for directories up to this depth (implies --rollup)",
+)
+def dump(
+    input_file,
+    scan_root,
+    jobs,
+    one_file_system,
+    include_sizes,
+    ignore_dirs,
+    output_format,
+    output_path,
+    size_key,
+    dedup_hardlinks,
+    min_size,
+    max_depth,
+    name_glob,
+    name_regex,
+    file_types,
+    exclude,
+    top,
+    by_extension,
+    rollup,
+    rollup_depth,
+):
+    """Dumps the entries of an export (or a fresh scan), or reports on them"""
+    if (input_file is None) == (scan_root is None):
+        raise click.UsageError("Must specify exactly one of --file or --scan")
+    filters = Filters(min_size=min_size, max_depth=max_depth, size_key=size_key)
+    if name_glob is not None and name_regex is not None:
+        raise click.UsageError("Cannot specify both --glob and --regex")
+    elif name_glob is not None:
+        filters.match_name = re.compile(fnmatch.translate(name_glob)).match
+    elif name_regex is not None:
+        try:
+            filters.match_name = re.compile(name_regex).search
+        except re.error as e:
+            raise click.BadParameter(str(e), param_hint="--regex") from None
+    if file_types or ignore_dirs:
+        types = frozenset(map(FileType, file_types)) if file_types else frozenset(FileType)
+        filters.types = types - {FileType.DIR} if ignore_dirs else types
+    if exclude:
+        filters.exclude = compile_globs(exclude)
+    if rollup and rollup_depth is None:
+        rollup_depth = sys.maxsize
+    reporting = top or by_extension or rollup_depth is not None
+    if output_format == "sqlite":
+        if reporting:
+            raise click.UsageError("Reports cannot be written to sqlite")
+        elif output_path == "-":
+            raise click.UsageError("Must specify an output file for sqlite")
+        elif size_key != "asize":
+            raise click.UsageError("The sqlite output always includes both the apparent size and disk usage")
+    else:
+        output_file = click.get_current_context().with_resource(click.open_file(output_path, "wt", lazy=False))
     match output_format:
+        case "sqlite":
+            output = SQLiteOutput(Path(output_path))
+        case _ if reporting:
+            output = ReportOutput(
+                output_file, output_format, top=top, by_extension=by_extension, rollup_depth=rollup_depth
+            )
         case "plain":
             output = PlainOutput(output_file, EntryField.SIZE if include_sizes else None)
         case "csv":
@@ -175,21 +1683,81 @@ def analyse_ncdu(input_file, include_sizes, output_format, output_file, ignore_d
             if include_sizes:
                 fields.append(EntryField.SIZE)
             output = CSVOutput(output_file, fields)
+        case "json":
+            output = JSONOutput(output_file, include_sizes)
         case _:
             raise AssertionError(output_format)
-    handled_entries = set()
+    if filters != Filters(size_key=size_key):
+        output.filters = filters
+    output.size_key = size_key
+    if dedup_hardlinks:
+        output.hardlinks = InodeSet()
+    # A counter instead of a set of paths, so memory use doesn't grow with the number of entries
+    handled_entries = 0
 
-    def should_keep(entry):
-        if ignore_dirs and entry.file_type == FileType.DIR:
-            return False
+    def count_entry(_entry):
+        nonlocal handled_entries
+        handled_entries += 1
+        return True
+
+    output.entry_filter = count_entry
+    try:
+        if scan_root is not None:
+            # excluded directories are never even listed
+            scanner = Scanner(scan_root, jobs=jobs, one_file_system=one_file_system, exclude=filters.exclude)
+            root_path = output.handle_events(scanner.events())
         else:
-            handled_entries.add(entry.full_path)
-            return True
+            with read_export(input_file, jobs=jobs) as events:
+                root_path = output.handle_events(events)
+    finally:
+        if isinstance(output, SQLiteOutput):
+            output.close()
+    print(f"Handled {handled_entries} entries in {root_path}", file=sys.stderr)
+
+
+def read_sorted(input_file: Path, chunk_size: int) -> SortedEntries:
+    entries = SortedEntries(chunk_size=chunk_size)
+    with read_export(input_file) as events:
+        entries.handle_events(events)
+    return entries
+
+
+@analyse_ncdu.command()
+@click.argument("old_file", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.argument("new_file", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@output_format_option()
+@output_file_option
+@click.option(
+    "--rollup-depth",
+    type=click.IntRange(min=0),
+    help="Only report the growth of directories up to this depth",
+)
+@click.option("--dirs-only", is_flag=True, help="Only report the growth of directories, not individual entries")
+@click.option(
+    "--sort-chunk-size",
+    type=click.IntRange(min=1),
+    default=SortedEntries.DEFAULT_CHUNK_SIZE,
+    show_default=True,
+    help="The number of entries to sort in memory before spilling to a temporary file",
+)
+def diff(old_file, new_file, output_format, output_file, rollup_depth, dirs_only, sort_chunk_size):
+    """
+    Reports the paths which were added, removed, grown, or shrunk between two exports
 
-    output.entry_filter = should_keep
-    assert isinstance(data[3], list)
-    root_path = output.handle_raw_entry(Path(), data[3], is_dir=True)
-    print(f"Handled {len(handled_entries)} entries in {root_path}", file=sys.stderr)
+    Also reports the growth of each directory (recursively).
+    Paths are relative to the root of each export.
+    """
+    old_entries = read_sorted(old_file, sort_chunk_size)
+    try:
+        new_entries = read_sorted(new_file, sort_chunk_size)
+        try:
+            output = DiffOutput(output_file, output_format, rollup_depth=rollup_depth, entries=not dirs_only)
+            changes = output.diff(old_entries, new_entries)
+        finally:
+            new_entries.close()
+    finally:
+        old_entries.close()
+    print(f"Found {changes} changed entries", file=sys.stderr)
 
 
 if __name__ == "__main__":
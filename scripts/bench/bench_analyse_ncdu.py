@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Benchmark analyse-ncdu.py against its original `json.load` implementation
+
+Generates a synthetic ncdu export in a temporary directory (or reuses one with `--export`).
+Each case runs in a fresh subprocess, so that its peak RSS can be measured.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import TextIO
+
+from load_script import load_script
+
+
+def generate_export(out: TextIO, *, entries: int, fanout: int, seed: int) -> None:
+    """
+    Write a synthetic ncdu export with roughly the specified number of entries
+
+    About one in ten entries is a directory, and directories nest at most 12 deep.
+    """
+    rng = random.Random(seed)
+    count = 0
+
+    def info(name: str, *, is_dir: bool) -> str:
+        nonlocal count
+        count += 1
+        data = {"name": name, "asize": 4096 if is_dir else rng.randrange(1 << 20), "dsize": 4096, "ino": count}
+        return json.dumps(data, separators=(",", ":"))
+
+    def write_dir(name: str, depth: int) -> None:
+        out.write("[" + info(name, is_dir=True))
+        for i in range(rng.randrange(1, 2 * fanout)):
+            if count >= entries:
+                break
+            out.write(",\n")
+            if depth < 12 and rng.random() < 0.1:
+                write_dir(f"dir{i}", depth + 1)
+            else:
+                out.write(info(f"file{i}.dat", is_dir=False))
+        out.write("]")
+
+    out.write('[1,2,{"progname":"ncdu","progver":"2.3","timestamp":0},\n[')
+    out.write(info("/data", is_dir=True))
+    i = 0
+    while count < entries:
+        out.write(",\n")
+        write_dir(f"top{i}", 1)
+        i += 1
+    out.write("]]\n")
+
+
+def legacy_analyse(export: Path, out: TextIO) -> int:
+    """The original implementation: `json.load`, then recursion building a `Path` and `Entry` per item"""
+
+    @dataclass
+    class Entry:
+        full_path: Path
+        file_type: Enum
+        size: int | None
+
+    FileType = Enum("FileType", ["FILE", "OTHER", "DIR"])
+    handled = set()
+
+    def handle(parent: Path, data, *, is_dir: bool) -> Path | None:
+        if isinstance(data, list):
+            raw_root = data[0]
+            if "excluded" in raw_root:
+                return None
+            root_path = handle(parent, raw_root, is_dir=True)
+            for child in data[1:]:
+                handle(root_path, child, is_dir=isinstance(child, list))
+            return root_path
+        if "excluded" in data:
+            return None
+        if data.get("notreg"):
+            file_type, size = FileType.OTHER, data.get("asize")
+        elif is_dir:
+            file_type, size = FileType.DIR, None
+        else:
+            file_type, size = FileType.FILE, int(data.get("asize", 0))
+        entry = Entry(parent / data["name"], file_type, size)
+        handled.add(entry.full_path)
+        out.write(f"{entry.full_path} {entry.size if entry.size is not None else entry.file_type}\n")
+        return entry.full_path
+
+    with open(export, "rt") as f:
+        data = json.load(f)
+    handle(Path(), data[3], is_dir=True)
+    return len(handled)
+
+
+def streaming_analyse(export: Path, out: TextIO) -> int:
+    analyse_ncdu = load_script("analyse-ncdu.py")
+    output = analyse_ncdu.PlainOutput(out, analyse_ncdu.EntryField.SIZE)
+    count = 0
+
+    def count_entry(_entry) -> bool:
+        nonlocal count
+        count += 1
+        return True
+
+    output.entry_filter = count_entry
+    with open(export, "rt") as f:
+        output.handle_events(analyse_ncdu.NcduReader(f).events())
+    return count
+
+
+CASES = {
+    "json.load (original)": legacy_analyse,
+    "NcduReader + DirStore": streaming_analyse,
+}
+
+
+def run_case(name: str, export: Path) -> None:
+    """Run a single case in this process, printing the results as JSON"""
+    start = time.perf_counter()
+    with open(os.devnull, "wt") as out:
+        count = CASES[name](export, out)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux, but bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    print(json.dumps({"count": count, "elapsed": elapsed, "max_rss": max_rss}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10_000_000)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--export", type=Path, help="Reuse (or create) the export at this path")
+    parser.add_argument("--cases", nargs="*", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--run-case", choices=list(CASES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_case is not None:
+        run_case(args.run_case, args.export)
+        return
+    with tempfile.TemporaryDirectory(prefix="bench-analyse-ncdu-") as tmp:
+        export = args.export or Path(tmp, "export.json")
+        if not export.exists():
+            with open(export, "wt") as f:
+                generate_export(f, entries=args.entries, fanout=args.fanout, seed=args.seed)
+        size_mib = export.stat().st_size / (1 << 20)
+        print(f"Synthetic export: {args.entries} entries, {size_mib:.0f} MiB", file=sys.stderr)
+        counts = set()
+        for name in args.cases:
+            proc = subprocess.run(
+                [sys.executable, __file__, "--run-case", name, "--export", str(export)],
+                check=True,
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            result = json.loads(proc.stdout)
+            counts.add(result["count"])
+            rate = result["count"] / result["elapsed"] / 1000
+            print(
+                f"{name:<22} {result['elapsed']:8.2f}s  {rate:8.1f}k entries/s  "
+                f"peak RSS {result['max_rss'] / (1 << 20):8.1f} MiB"
+            )
+        assert len(counts) == 1, f"Mismatched entry counts: {counts}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark findrepo against its original `os.walk` implementation
+
+Builds a synthetic tree of repositories and plain directories in a temporary directory.
+Each group also has a project with ignored build outputs, which are pruned by default.
+All measurements are on a warm file cache.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from load_script import load_script
+
+
+def legacy_findrepo(root: str) -> list[str]:
+    """The original implementation, using os.walk and up to three probes per directory"""
+
+    def is_git_dir(git_dir: str, /) -> bool:
+        return os.path.isfile(f"{git_dir}/HEAD")
+
+    def is_vcs_repo(pth: str, /) -> bool:
+        return is_git_dir(f"{pth}/.git") or is_git_dir(pth) or os.path.isdir(f"{pth}/.hg/store")
+
+    res = []
+    for dir_root, dirs, _files in os.walk(root):
+        for entry_name in dirs.copy():
+            entry = f"{dir_root}/{entry_name}"
+            if is_vcs_repo(entry):
+                dirs.remove(entry_name)
+                res.append(entry)
+    return res
+
+
+def build_tree(root: Path, *, groups: int, repos: int, fanout: int, depth: int) -> tuple[int, int]:
+    """
+    Build the synthetic tree, returning the number of directories and repos
+
+    Each group has the specified number of repos (each with a small worktree),
+    and a tree of plain directories with the specified fanout and depth.
+    It also has a project (not a repo) whose `.gitignore` excludes build outputs and caches,
+    each of which is another plain tree.
+    """
+    dir_count = 0
+    repo_count = 0
+
+    def plain_tree(pth: Path, level: int) -> None:
+        nonlocal dir_count
+        pth.mkdir()
+        dir_count += 1
+        for i in range(fanout):
+            (pth / f"file{i}.txt").touch()
+        if level < depth:
+            for i in range(fanout):
+                plain_tree(pth / f"dir{i}", level + 1)
+
+    for g in range(groups):
+        group_dir = root / f"group{g}"
+        group_dir.mkdir()
+        dir_count += 1
+        for r in range(repos):
+            repo = group_dir / f"repo{r}"
+            for sub in (".git/objects", ".git/refs/heads", "src/module", "docs"):
+                (repo / sub).mkdir(parents=True)
+            (repo / ".git/HEAD").write_text("ref: refs/heads/main\n")
+            (repo / "README.md").touch()
+            dir_count += 7
+            repo_count += 1
+        plain_tree(group_dir / "scratch", 1)
+        project = group_dir / "project"
+        project.mkdir()
+        dir_count += 1
+        (project / ".gitignore").write_text("node_modules/\n/target\n.venv\n*.egg-info\n")
+        for ignored in ("node_modules", "target", ".venv", ".cache", "pkg.egg-info"):
+            plain_tree(project / ignored, 2)
+    return dir_count, repo_count
+
+
+def measure(func: Callable[[], object], *, runs: int) -> list[float]:
+    func()  # warm the file cache
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--groups", type=int, default=40)
+    parser.add_argument("--repos", type=int, default=50, help="The number of repos per group")
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--threads", type=int, nargs="*", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    findrepo = load_script("findrepo")
+    with tempfile.TemporaryDirectory(prefix="bench-findrepo-") as tmp:
+        root = Path(tmp)
+        dir_count, repo_count = build_tree(
+            root, groups=args.groups, repos=args.repos, fanout=args.fanout, depth=args.depth
+        )
+        print(f"Synthetic tree: {dir_count} directories, {repo_count} repos", file=sys.stderr)
+        # No repos are inside ignored or hidden directories, so pruning them never changes the results
+        expected = sorted(legacy_findrepo(str(root)))
+        assert len(expected) == repo_count, len(expected)
+        cases: dict[str, Callable[[], object]] = {"os.walk (original)": lambda: legacy_findrepo(str(root))}
+        unrestricted = {"hidden": True, "respect_ignore": False}
+        actual = sorted(findrepo.RepoWalker(str(root), jobs=1, **unrestricted))
+        assert actual == expected, "Mismatched results when unrestricted"
+        cases["RepoWalker -j1 -u"] = lambda: list(findrepo.RepoWalker(str(root), jobs=1, **unrestricted))
+        for jobs in args.threads:
+            actual = sorted(findrepo.RepoWalker(str(root), jobs=jobs))
+            assert actual == expected, f"Mismatched results with {jobs} threads"
+            cases[f"RepoWalker -j{jobs}"] = lambda jobs=jobs: list(findrepo.RepoWalker(str(root), jobs=jobs))
+        # Following links needs a (st_dev, st_ino) per directory, which mostly comes from the listing
+        follow = {
+            "follow": True,
+            "mounts": findrepo.read_mounts(),
+            "excluded_fstypes": findrepo.DEFAULT_EXCLUDED_FSTYPES,
+        }
+        assert sorted(findrepo.RepoWalker(str(root), jobs=1, **follow)) == expected
+        cases["RepoWalker -j1 -L"] = lambda: list(findrepo.RepoWalker(str(root), jobs=1, **follow))
+        # Build the index once, then measure the incremental refresh (a stat per directory)
+        # and answering directly from the stored index
+        index = findrepo.RepoIndex(root / "index.json", str(root), {}, {})
+        walker = findrepo.RepoWalker(str(root), jobs=1, index=index)
+        assert sorted(walker) == expected and walker.completed
+        index.save()
+        cases["RepoIndex refresh -j1"] = lambda: list(
+            findrepo.RepoWalker(str(root), jobs=1, index=findrepo.RepoIndex.load_from(index.path, str(root), {}))
+        )
+        cases["RepoIndex stored"] = lambda: list(
+            findrepo.RepoWalker(
+                str(root),
+                jobs=1,
+                index=findrepo.RepoIndex.load_from(index.path, str(root), {}),
+                stored_only=True,
+            )
+        )
+        for name, func in cases.items():
+            timings = measure(func, runs=args.runs)
+            print(f"{name:<22} min {min(timings) * 1000:8.1f}ms  median {statistics.median(timings) * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark hash_tarfile_entries against its original process-per-entry implementation
+
+Builds a synthetic compressed tarball in a temporary directory, with many small members and a few large ones,
+along with a zipfile holding the same members.
+The original runs `bsdtar -xf` (falling back to GNU tar if bsdtar is missing) and `sha256sum` for every entry,
+which decompresses the archive from the start each time.
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from collections.abc import Callable
+from pathlib import Path
+
+from load_script import load_script
+
+
+def compress_zstd(src: Path, dest: Path) -> None:
+    try:
+        from compression.zstd import ZstdFile  # Python 3.14+
+    except ImportError:
+        import zstandard
+
+        with open(src, "rb") as fin, open(dest, "wb") as fout:
+            zstandard.ZstdCompressor().copy_stream(fin, fout)
+    else:
+        with open(src, "rb") as fin, ZstdFile(dest, "w") as fout:
+            shutil.copyfileobj(fin, fout)
+
+
+def build_archive(
+    path: Path, zip_path: Path, *, compression: str, members: int, large: int, large_size: int, seed: int
+) -> int:
+    """Write a compressed tarball and a zipfile with the same members, returning the total size of those members"""
+    rng = random.Random(seed)
+    total = 0
+    # tarfile only supports zstd from Python 3.14, so compress that afterwards
+    tar_path = path.with_suffix("") if compression == "zst" else path
+    tar_mode = "w" if compression == "zst" else f"w:{compression}"
+    with (
+        tarfile.open(tar_path, tar_mode) as archive,
+        zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zip_archive,
+    ):
+        for i in range(members):
+            size = large_size if i < large else rng.randrange(1 << 16)
+            # half random, half repetitive, so it compresses somewhat
+            data = rng.randbytes(size // 2) + bytes(size - size // 2)
+            info = tarfile.TarInfo(f"data/dir{i % 50}/file{i}.bin")
+            info.size = size
+            archive.addfile(info, io.BytesIO(data))
+            zip_archive.writestr(info.name, data)
+            total += size
+    if compression == "zst":
+        compress_zstd(tar_path, path)
+        tar_path.unlink()
+    return total
+
+
+def legacy_hash(archive: Path, *, tar_command: str, jobs: int) -> list[str]:
+    """The original implementation: list the entries, then spawn a tar and a checksum process per entry"""
+    entries = subprocess.run(
+        [tar_command, "-tf", archive], stdout=subprocess.PIPE, check=True, encoding="utf-8"
+    ).stdout.splitlines()
+
+    def hash_entry(entry: str) -> str:
+        tar_proc = subprocess.Popen([tar_command, "--to-stdout", "-xf", archive, "--", entry], stdout=subprocess.PIPE)
+        hash_proc = subprocess.Popen(["sha256sum"], stdin=tar_proc.stdout, stdout=subprocess.PIPE, encoding="utf-8")
+        assert tar_proc.stdout is not None
+        tar_proc.stdout.close()
+        out, _ = hash_proc.communicate()
+        assert tar_proc.wait() == 0 and hash_proc.returncode == 0
+        return f"{out.split()[0]}  {entry}"
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(hash_entry, [entry for entry in entries if not entry.endswith("/")]))
+
+
+def stream_hash(module, archive: Path, *, jobs: int) -> list[str]:
+    context = module.StreamHashContext(tar_file=archive, hash_format="sha256", jobs=jobs)
+    return [f"{checksum}  {entry}" for checksum, entry in context.hash_entries()]
+
+
+def zip_hash(module, zip_archive: Path, *, jobs: int) -> list[str]:
+    context = module.ZipHashContext(zip_file=zip_archive, hash_format="sha256", jobs=jobs)
+    return [f"{checksum}  {entry}" for checksum, entry in context.hash_entries()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--large", type=int, default=4, help="The number of large members")
+    parser.add_argument("--large-size", type=int, default=8 << 20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compression", choices=["gz", "xz", "bz2", "zst"], default="gz")
+    parser.add_argument("--threads", type=int, nargs="*", default=[1, 2, 4])
+    parser.add_argument("--skip-legacy", action="store_true", help="Skip the (very slow) original implementation")
+    args = parser.parse_args()
+    module = load_script("hash_tarfile_entries")
+    with tempfile.TemporaryDirectory(prefix="bench-hash-tarfile-") as tmp:
+        archive = Path(tmp, f"archive.tar.{args.compression}")
+        zip_archive = Path(tmp, "archive.zip")
+        total = build_archive(
+            archive,
+            zip_archive,
+            compression=args.compression,
+            members=args.members,
+            large=args.large,
+            large_size=args.large_size,
+            seed=args.seed,
+        )
+        print(
+            f"Synthetic archive: {args.members} members, {total / (1 << 20):.0f} MiB "
+            f"({archive.stat().st_size / (1 << 20):.0f} MiB compressed)",
+            file=sys.stderr,
+        )
+        cases: dict[str, Callable[[], list[str]]] = {}
+        tar_command = shutil.which("bsdtar") or shutil.which("tar")
+        if not args.skip_legacy and tar_command is not None:
+            name = f"{os.path.basename(tar_command)} per entry (original)"
+            cases[name] = lambda: legacy_hash(archive, tar_command=tar_command, jobs=2)
+        for jobs in args.threads:
+            cases[f"tarfile stream -j{jobs}"] = lambda jobs=jobs: stream_hash(module, archive, jobs=jobs)
+        for jobs in args.threads:
+            cases[f"zipfile -j{jobs}"] = lambda jobs=jobs: zip_hash(module, zip_archive, jobs=jobs)
+        expected = None
+        for name, func in cases.items():
+            start = time.perf_counter()
+            lines = func()
+            elapsed = time.perf_counter() - start
+            if expected is None:
+                expected = lines
+            assert lines == expected, f"Mismatched results for {name}"
+            print(f"{name:<30} {elapsed:8.2f}s  {total / elapsed / (1 << 20):8.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    main()
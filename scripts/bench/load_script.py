@@ -0,0 +1,26 @@
+"""
+Loads the scripts being benchmarked as modules
+
+The scripts in `scripts/` can't be imported normally,
+since they either lack a `.py` suffix or have dashes in their names.
+"""
+
+from __future__ import annotations
+
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from pathlib import Path
+from types import ModuleType
+
+SCRIPTS_PATH = Path(__file__).resolve().parents[1]
+
+
+def load_script(file_name: str, /) -> ModuleType:
+    """Load `scripts/<file_name>`, naming the module after the script (with underscores instead of dashes)"""
+    module_name = file_name.removesuffix(".py").replace("-", "_")
+    loader = SourceFileLoader(module_name, str(SCRIPTS_PATH / file_name))
+    spec = spec_from_loader(module_name, loader)
+    assert spec is not None
+    module = module_from_spec(spec)
+    loader.exec_module(module)
+    return module
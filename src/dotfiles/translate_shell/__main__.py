@@ -11,7 +11,6 @@ import warnings
 from abc import ABCMeta, abstractmethod
 from contextlib import (
     AbstractContextManager,
-    ExitStack,
     contextmanager,
     redirect_stdout,
 )
@@ -36,6 +35,8 @@ from typing import get_origin as get_type_origin
 # TODO: Once requiring 3.11 we can remove this
 if TYPE_CHECKING:
     from typing_extensions import assert_never
+
+    from dotfiles.translate_shell.probe import PlatformSnapshot
 else:
 
     def assert_never(val):
@@ -207,6 +208,7 @@ PathOrderSpec.DEFAULT = PathOrderSpec.APPEND
 
 class _Scope(Enum):
     EXPORT = "export"
+    GLOBAL = "global"
     LOCAL = "local"
     ALIAS = "alias"
 
@@ -214,6 +216,8 @@ class _Scope(Enum):
 @dataclass
 class ModeState:
     added_python_paths: list[Path] = field(default_factory=list)
+    path_changes: list[tuple[str, PathOrderSpec]] = field(default_factory=list)
+    """Entries added to `$PATH`, used by `analyze-path`"""
 
 
 class _AliasSpecialWraps(Enum):
@@ -426,6 +430,11 @@ class Mode(metaclass=ABCMeta):
     def export(self, name: str, value: ShellValue):
         self._assign(name, value, scope=_Scope.EXPORT, export=True)
 
+    @final
+    def set_global(self, name: str, value: ShellValue):
+        """Set a global shell variable, which is not exported to child processes"""
+        self._assign(name, value, scope=_Scope.GLOBAL, export=False)
+
     ALIAS_WRAPS_UPDATED: Final[AliasWrapsSetting] = _AliasSpecialWraps.UPDATED
     ALIAS_WRAPS_ORIGINAL: Final[AliasWrapsSetting] = _AliasSpecialWraps.ORIGINAL
 
@@ -493,6 +502,8 @@ class Mode(metaclass=ABCMeta):
             raise TypeError(type(value))
         if var_name is not None and "PATH" not in var_name:
             self.warning("Unexpected variable name: {var_name!r}")
+        if var_name in (None, "PATH") and self._state is not None:
+            self._state.path_changes.append((str(value), order))
         self._extend_path_impl(str(value), var_name, order=order)
 
     @abstractmethod
@@ -562,6 +573,9 @@ class ZshMode(Mode):
         self._write("source", str(f))
 
     def _assign(self, name: str, value: ShellValue, *, scope: _Scope, export: bool):
+        if scope == _Scope.GLOBAL:
+            self._write("typeset", "-g", f"{name}={self._quote(value)}")
+            return
         flags = []
         if not export:
             match scope:
@@ -656,11 +670,14 @@ class XonshMode(Mode):
 
     def _assign(self, name: str, value: ShellValue, *, scope: _Scope, export: bool):
         target: str
-        if scope != _Scope.LOCAL and not export:
+        if scope not in (_Scope.LOCAL, _Scope.GLOBAL) and not export:
             raise NotImplementedError
         match scope:
             case _Scope.EXPORT:
                 target = f"${name}"
+            case _Scope.GLOBAL:
+                # a python variable, since every environment variable is exported
+                target = name
             case _Scope.LOCAL:
                 target = f"${name}" if export else name
             case _Scope.ALIAS:
@@ -749,7 +766,7 @@ class FishMode(Mode):
     name: ClassVar = "fish"
     # TODO: This is a hack
     helper_path: ClassVar = Path(__file__).parent / "fish_helpers.fish"
-    cleanup_code: ClassVar = "clear_helper_funcs\nset --erase clear_helper_funcs"
+    cleanup_code: ClassVar = "clear_helper_funcs\nfunctions --erase clear_helper_funcs"
 
     def eval_text(self, text: str):
         self._write("eval", self._quote(text))
@@ -761,7 +778,7 @@ class FishMode(Mode):
         value = self._quote(value)
         set_scope = None
         match scope:
-            case _Scope.EXPORT:
+            case _Scope.EXPORT | _Scope.GLOBAL:
                 set_scope = "--global"
             case _Scope.LOCAL:
                 assert self._block_level > 0
@@ -773,7 +790,7 @@ class FishMode(Mode):
         flags = [set_scope]
         if export:
             flags.append("--export")
-        elif scope != _Scope.LOCAL:
+        elif scope not in (_Scope.LOCAL, _Scope.GLOBAL):
             raise NotImplementedError
         self._write("set", *flags, name, value)
 
@@ -901,14 +918,22 @@ class Platform(Enum):
     MAC_OS = "darwin"
 
     @staticmethod
-    def current():
+    def current() -> Platform:
+        from dotfiles.translate_shell import probe
+
+        platform = probe.current_snapshot().platform
         try:
-            return Platform(sys.platform)
-        except KeyError:
-            raise UnsupportedPlatformError(sys.platform) from None
+            return Platform(platform)
+        except ValueError:
+            raise UnsupportedPlatformError(platform) from None
 
     def is_desktop(self) -> bool:
         """Detect if this platform is running on a Desktop computer"""
+        from dotfiles.translate_shell import probe
+
+        snapshot = probe.current_snapshot()
+        if self.value == snapshot.platform:
+            return snapshot.is_desktop
         match self:
             case Platform.LINUX:
                 # Check for X11 installation
@@ -927,19 +952,19 @@ class AppDir(Enum):
     USER_DATA = "~/.local/share"
 
     def resolve(self, platform: Platform) -> Path:
-        path: Path
-        match (platform, self):
-            case (Platform.LINUX, _):
-                # linux is easy (designed that way)
-                path = Path(self.value).expanduser()
-            case (Platform.MAC_OS, AppDir.USER_CONFIG) | (
-                Platform.MAC_OS,
-                AppDir.USER_DATA,
-            ):
-                path = Path.home() / "Library/Application Support"
-            case _:
-                raise UnsupportedPlatformError(platform, f"Unknown directory {self}")
-        if not path.is_dir():
+        from dotfiles.translate_shell import probe
+
+        try:
+            path = probe.resolve_app_dir(platform.value, self.name)
+        except KeyError:
+            raise UnsupportedPlatformError(platform, f"Unknown directory {self}") from None
+        snapshot = probe.current_snapshot()
+        if platform.value == snapshot.platform:
+            # avoid the is_dir check, which was already done by the probe
+            exists = snapshot.app_dirs.get(self.name) is not None
+        else:
+            exists = path.is_dir()
+        if not exists:
             raise FileNotFoundError(f"Expected {self} at {str(path)!r}")
         else:
             return path
@@ -954,10 +979,35 @@ for name, mode in _VALID_MODES.items():
     assert mode.name == name, mode.name
 
 
-def run_mode(mode: Mode, module_name: str) -> list[str]:
+def emit_probe_variables(mode: Mode, snapshot: PlatformSnapshot):
+    """
+    Emit the results of the platform probe as precomputed shell variables
+
+    This avoids the need for the shell to detect them itself (see common.fish).
+    Like the detected values, these are globals which aren't exported to child processes.
+    """
+    mode.set_global("MACHINE_PLATFORM", snapshot.platform)
+    if snapshot.distro is not None:
+        mode.set_global("MACHINE_DISTRO", snapshot.distro)
+    for name, app_dir in snapshot.app_dirs.items():
+        if app_dir is not None:
+            mode.set_global(f"MACHINE_{name}_DIR", app_dir)
+
+
+def run_mode(
+    mode: Mode,
+    module_name: str,
+    *,
+    state: ModeState | None = None,
+    extra_context: dict[str, Any] | None = None,
+) -> list[str]:
     assert not mode._output, "Already have output for mode"
     if (helper := mode.helper_path) is not None:
         mode.source_file(DOTFILES_PATH / helper)
+    from dotfiles.translate_shell import probe
+
+    snapshot = probe.current_snapshot()
+    emit_probe_variables(mode, snapshot)
     assert isinstance(DOTFILES_PATH, Path)
     # TODO: Isolate to the specific module, not everything
     warnings.filterwarnings("default", category=DeprecationWarning)
@@ -966,6 +1016,7 @@ def run_mode(mode: Mode, module_name: str) -> list[str]:
         "DOTFILES_PATH": DOTFILES_PATH,
         "PathOrderSpec": PathOrderSpec,
         "PLATFORM": Platform.current(),
+        "PLATFORM_PROBE": snapshot,
         "Platform": Platform,
         "AppDir": AppDir,
         "UnsupportedPlatformError": UnsupportedPlatformError,
@@ -977,9 +1028,11 @@ def run_mode(mode: Mode, module_name: str) -> list[str]:
         if attr_name.startswith("_") or attr_name in Mode.AUTOEXPORT_EXCLUDE:
             continue
         context[attr_name] = getattr(mode, attr_name)
+    if extra_context is not None:
+        context.update(extra_context)
     # stdout is only for translation output, not messages
     with redirect_stdout(sys.stderr):
-        with mode.with_state() as state:
+        with mode.with_state(state) as active_state:
             runpy.run_module(
                 module_name,
                 init_globals=context,
@@ -989,7 +1042,7 @@ def run_mode(mode: Mode, module_name: str) -> list[str]:
             # extend them to outer context
             #
             # TODO: Instead, tell runpy not to reset sys.path
-            for added_path in state.added_python_paths:
+            for added_path in active_state.added_python_paths:
                 if str(added_path) not in sys.path:
                     sys.path.append(str(added_path))
         # Cleanup
@@ -999,6 +1052,45 @@ def run_mode(mode: Mode, module_name: str) -> list[str]:
     return mode._output
 
 
+def simulate_path(base_path: list[str], changes: list[tuple[str, PathOrderSpec]]) -> list[str]:
+    """
+    Determine the `$PATH` resulting from applying the specified changes to the system paths
+
+    Mirrors the semantics of `add_path_any` in fish,
+    where user paths always come before the system paths.
+    Unlike `fish_add_path`, duplicates are intentionally kept.
+    """
+    user_paths: list[str] = []
+    system_paths = list(base_path)
+    for value, order in changes:
+        match order:
+            case PathOrderSpec.PREPEND:
+                user_paths.insert(0, value)
+            case PathOrderSpec.APPEND:
+                user_paths.append(value)
+            case PathOrderSpec.APPEND_SYSTEM:
+                system_paths.append(value)
+            case _ as unreachable:
+                if TYPE_CHECKING:
+                    assert_never(unreachable)
+                raise TypeError(unreachable)
+    return user_paths + system_paths
+
+
+def analyze_path(mode_type: type[Mode], in_modules: list[str], *, base_path: Optional[str], verbose: bool):
+    from dotfiles.translate_shell.path_analysis import PathAnalysis, default_base_path
+
+    state = ModeState()
+    for in_mod in in_modules:
+        # discard translated output, only the path changes matter
+        run_mode(mode_type(), in_mod, state=state)
+        state.added_python_paths.clear()
+    base_entries = base_path.split(os.pathsep) if base_path is not None else default_base_path()
+    analysis = PathAnalysis.analyze(simulate_path(base_entries, state.path_changes))
+    for line in analysis.format_report(verbose=verbose):
+        print(line)
+
+
 def main():
     remaining_args = sys.argv[1:]
 
@@ -1017,9 +1109,15 @@ def main():
             print(f"Expected an argument to {flag_name} flag", file=sys.stderr)
             sys.exit(1)
 
+    subcommand = None
+    if remaining_args and remaining_args[0] == "analyze-path":
+        subcommand = remaining_args.pop(0)
+
     mode_type = None
     in_modules = []
     out_files = []
+    base_path = None
+    verbose = False
     while remaining_args and (flag := remaining_args[0]).startswith("-"):
         match flag:
             case "--":
@@ -1064,6 +1162,18 @@ def main():
             case "--out" | "-o":
                 out_files.append(Path(require_arg("--out")))
                 consume_arg(amount=2)
+            case "--reprobe":
+                # Discard the cached platform probe
+                from dotfiles.translate_shell import probe
+
+                probe.invalidate()
+                consume_arg()
+            case "--base-path" if subcommand == "analyze-path":
+                base_path = require_arg("--base-path")
+                consume_arg(amount=2)
+            case "--verbose" | "-v" if subcommand == "analyze-path":
+                verbose = True
+                consume_arg()
             case _:
                 print(f"Unexpected flag: {flag!r}", file=sys.stderr)
                 sys.exit(1)
@@ -1072,6 +1182,14 @@ def main():
         print("ERROR: Got no input modules", file=sys.stderr)
         sys.exit(1)
 
+    if subcommand == "analyze-path":
+        if out_files:
+            print("ERROR: analyze-path does not accept --out", file=sys.stderr)
+            sys.exit(1)
+        # The mode does not matter for the path changes, so default to my primary shell
+        analyze_path(mode_type or FishMode, in_modules, base_path=base_path, verbose=verbose)
+        return
+
     if len(in_modules) == 1 and len(out_files) == 0:
         # With only one in file (and no explicit output), write to stdout
         out_files.append(sys.stdout)
@@ -1083,16 +1201,28 @@ def main():
         )
         sys.exit(1)
 
-    for in_mod, out_file in zip(in_modules, out_files, strict=True):
-        # Avoid contextlib due to potential for longer import times
-        with ExitStack() as stack:
-            if isinstance(out_file, Path):
-                out_file_handle = stack.enter_context(open(out_file, "wt"))
-            else:
-                out_file_handle = out_file
-            mode = mode_type()  # Construct mode object
-            for line in run_mode(mode, in_mod):
-                print(line, file=out_file_handle)
+    # Render everything before writing anything,
+    # so a failed translation never leaves partial output behind
+    rendered: list[str] = []
+    for in_mod in in_modules:
+        mode = mode_type()  # Construct mode object
+        rendered.append("".join(line + "\n" for line in run_mode(mode, in_mod)))
+
+    hashes = None
+    for out_file, text in zip(out_files, rendered, strict=True):
+        if not isinstance(out_file, Path):
+            out_file.write(text)
+            continue
+        if hashes is None:
+            from dotfiles.translate_shell.cache import OutputHashes
+
+            hashes = OutputHashes()
+        if hashes.write_if_changed(out_file, text.encode("utf-8")):
+            print(f"Rewrote {out_file}", file=sys.stderr)
+        else:
+            print(f"Unchanged {out_file}", file=sys.stderr)
+    if hashes is not None:
+        hashes.save()
 
 
 if __name__ == "__main__":
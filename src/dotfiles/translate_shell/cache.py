@@ -0,0 +1,112 @@
+"""
+Persistent state for the translator, stored in `$XDG_CACHE_HOME/dotfiles`
+
+Like `path_analysis`, this does not depend on `__main__`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+
+def cache_dir() -> Path:
+    """The directory for cached dotfiles state, which is created if missing"""
+    base = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    res = Path(base, "dotfiles")
+    res.mkdir(parents=True, exist_ok=True)
+    return res
+
+
+def atomic_write(target: Path, data: bytes) -> None:
+    """
+    Replace the target file with the specified data.
+
+    Writes to a temporary file in the same directory, then renames it with `os.replace`.
+    Readers see either the old or the new contents, never a partial write.
+    """
+    fd, temp_name = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        try:
+            # mkstemp always uses 0600, so preserve the original permissions
+            os.chmod(temp_name, os.stat(target).st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(temp_name, 0o644)
+        os.replace(temp_name, target)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class OutputHashes:
+    """
+    The content hashes of previously written outputs, used to skip identical rewrites.
+
+    Stored entries are only trusted if the file still has the same size and mtime,
+    otherwise the file is rehashed.
+    """
+
+    path: Path
+    _entries: dict[str, dict[str, Any]]
+    _dirty: bool
+
+    def __init__(self, path: Path | None = None):
+        self.path = path if path is not None else cache_dir() / "output-hashes.json"
+        self._dirty = False
+        try:
+            with open(self.path, "rb") as f:
+                self._entries = json.load(f)
+            if not isinstance(self._entries, dict):
+                raise ValueError
+        except (FileNotFoundError, ValueError):
+            self._entries = {}
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _matches(self, target: Path, digest: str) -> bool:
+        try:
+            st = os.stat(target)
+        except FileNotFoundError:
+            return False
+        entry = self._entries.get(str(target))
+        if entry is not None and entry.get("mtime_ns") == st.st_mtime_ns and entry.get("size") == st.st_size:
+            return entry.get("sha256") == digest
+        # Unknown or modified since last run, so fall back to the actual contents
+        with open(target, "rb") as f:
+            actual_digest = self.digest(f.read())
+        self._record(target, actual_digest)
+        return actual_digest == digest
+
+    def _record(self, target: Path, digest: str) -> None:
+        st = os.stat(target)
+        self._entries[str(target)] = {"sha256": digest, "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+        self._dirty = True
+
+    def write_if_changed(self, target: Path, data: bytes) -> bool:
+        """Atomically write the data to the target unless the contents are identical, returning if it was rewritten"""
+        target = target.absolute()
+        digest = self.digest(data)
+        if self._matches(target, digest):
+            return False
+        atomic_write(target, data)
+        self._record(target, digest)
+        return True
+
+    def save(self) -> None:
+        if self._dirty:
+            atomic_write(self.path, json.dumps(self._entries, indent=2, sort_keys=True).encode())
+            self._dirty = False
+
+
+__all__ = ("OutputHashes", "atomic_write", "cache_dir")
@@ -13,10 +13,12 @@ from .__main__ import (
     UnsupportedPlatformError,
     which,
 )
+from .probe import PlatformSnapshot
 
 SHELL_BACKEND: str
 DOTFILES_PATH: Path
 PLATFORM: Platform
+PLATFORM_PROBE: PlatformSnapshot
 _MODE_IMPL: Mode
 ALIAS_WRAPS_UPDATED: Final[AliasWrapsSetting]
 ALIAS_WRAPS_ORIGINAL: Final[AliasWrapsSetting]
@@ -56,6 +58,7 @@ __all__ = [
     "ALIAS_WRAPS_UPDATED",
     "ALIAS_WRAPS_ORIGINAL",
     "PLATFORM",
+    "PLATFORM_PROBE",
     "which",
     "reset_color",
     "require_var_equals",
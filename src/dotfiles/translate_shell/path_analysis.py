@@ -0,0 +1,174 @@
+"""
+Analysis of the `$PATH` produced by the generated config
+
+Reports redundancy (duplicate, missing, and empty entries),
+commands shadowed by earlier entries,
+and estimates the cost of a command lookup.
+
+This intentionally does not depend on `__main__`,
+so it can be imported lazily by the `analyze-path` subcommand.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+def default_base_path() -> list[str]:
+    """
+    Determine the system `$PATH`, before any user configuration is applied.
+
+    On macOS, this mimics `path_helper` by reading `/etc/paths` and `/etc/paths.d`.
+    Elsewhere, this falls back to the POSIX default (`confstr CS_PATH`).
+    """
+    if sys.platform == "darwin":
+        res: list[str] = []
+        path_files = [Path("/etc/paths")]
+        try:
+            path_files.extend(sorted(Path("/etc/paths.d").iterdir()))
+        except FileNotFoundError:
+            pass
+        for path_file in path_files:
+            try:
+                text = path_file.read_text()
+            except (FileNotFoundError, IsADirectoryError):
+                continue
+            res.extend(line.strip() for line in text.splitlines() if line.strip())
+        return res
+    try:
+        cs_path = os.confstr("CS_PATH")
+    except (ValueError, OSError):
+        cs_path = None
+    return (cs_path or os.defpath).split(os.pathsep)
+
+
+def _list_executables(directory: str, /) -> list[str] | None:
+    """List the executables in the specified directory, or `None` if it is missing"""
+    try:
+        with os.scandir(directory) as it:
+            return [
+                entry.name
+                for entry in it
+                # is_file follows symlinks, which is what a command lookup does
+                if entry.is_file() and os.access(entry.path, os.X_OK)
+            ]
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    except PermissionError:
+        return []
+
+
+@dataclass
+class PathAnalysis:
+    entries: list[str]
+    missing: list[int] = field(default_factory=list)
+    """Indexes of entries which do not exist (or are not directories)"""
+    duplicates: dict[int, int] = field(default_factory=dict)
+    """Maps the index of a redundant entry to the index of its first occurrence"""
+    empty: list[int] = field(default_factory=list)
+    """Indexes of existing directories which contain no executables"""
+    index: dict[str, list[int]] = field(default_factory=dict)
+    """Maps each command name to the indexes of all the entries providing it, in lookup order"""
+
+    @classmethod
+    def analyze(cls, entries: list[str]) -> PathAnalysis:
+        res = cls(entries=list(entries))
+        first_seen: dict[str, int] = {}
+        for idx, entry in enumerate(res.entries):
+            # resolve symlinks like /bin -> /usr/bin, which are redundant too
+            key = os.path.realpath(entry) if entry else entry
+            if (original := first_seen.get(key)) is not None:
+                res.duplicates[idx] = original
+                continue
+            first_seen[key] = idx
+            executables = _list_executables(entry or ".")
+            if executables is None:
+                res.missing.append(idx)
+            elif not executables:
+                res.empty.append(idx)
+            else:
+                for name in executables:
+                    res.index.setdefault(name, []).append(idx)
+        return res
+
+    @property
+    def shadowed(self) -> dict[str, list[int]]:
+        """Commands provided by more than one entry, where later entries are unreachable"""
+        return {name: providers for name, providers in self.index.items() if len(providers) > 1}
+
+    def pruned(self) -> list[str]:
+        """
+        The suggested `$PATH`, without the missing, duplicate, or empty entries.
+
+        This never changes which executable a command resolves to,
+        because the removed entries could never satisfy a lookup first.
+        """
+        removed = set(self.missing) | set(self.empty) | self.duplicates.keys()
+        return [entry for idx, entry in enumerate(self.entries) if idx not in removed]
+
+    def lookup_cost(self, entries: list[str] | None = None) -> tuple[float, int]:
+        """
+        Estimate the number of failed `stat` calls for a command lookup with the specified `$PATH`.
+
+        Returns the average cost to find a command in the index (weighting all commands equally),
+        and the cost of a lookup for a command which is not found.
+        Defaults to the original entries.
+        """
+        if entries is None:
+            entries = self.entries
+        position: dict[str, int] = {}
+        for pos, entry in enumerate(entries):
+            position.setdefault(os.path.realpath(entry) if entry else entry, pos)
+        failed_stats = 0
+        for providers in self.index.values():
+            first_provider = self.entries[providers[0]]
+            failed_stats += position[os.path.realpath(first_provider) if first_provider else first_provider]
+        average = failed_stats / len(self.index) if self.index else 0.0
+        return average, len(entries)
+
+    def format_report(self, *, verbose: bool = False) -> list[str]:
+        lines: list[str] = []
+
+        def describe(idx: int) -> str:
+            return f"#{idx} {self.entries[idx]!r}"
+
+        lines.append(f"Analyzed {len(self.entries)} entries, providing {len(self.index)} commands")
+        if self.duplicates:
+            lines.append(f"Duplicate entries ({len(self.duplicates)}):")
+            for idx, original in self.duplicates.items():
+                if self.entries[idx] == self.entries[original]:
+                    lines.append(f"  {describe(idx)} repeats #{original}")
+                else:
+                    lines.append(f"  {describe(idx)} is the same directory as {describe(original)}")
+        if self.missing:
+            lines.append(f"Nonexistent entries ({len(self.missing)}):")
+            lines.extend(f"  {describe(idx)}" for idx in self.missing)
+        if self.empty:
+            lines.append(f"Entries without executables ({len(self.empty)}):")
+            lines.extend(f"  {describe(idx)}" for idx in self.empty)
+        if shadowed := self.shadowed:
+            lines.append(f"Shadowed commands ({len(shadowed)}):")
+            for name, providers in sorted(shadowed.items()):
+                winner, *losers = providers
+                if verbose:
+                    lines.append(f"  {name}: {describe(winner)} shadows {', '.join(map(describe, losers))}")
+                else:
+                    lines.append(f"  {name}: #{winner} shadows {', '.join(f'#{idx}' for idx in losers)}")
+        pruned = self.pruned()
+        if len(pruned) < len(self.entries):
+            lines.append(f"Suggested PATH ({len(pruned)} entries):")
+            lines.extend(f"  {entry}" for entry in pruned)
+        else:
+            lines.append("No redundant entries")
+        before_avg, before_miss = self.lookup_cost()
+        after_avg, after_miss = self.lookup_cost(pruned)
+        lines.append("Estimated failed stats per lookup:")
+        lines.append(f"  found: {before_avg:.2f} -> {after_avg:.2f}")
+        lines.append(f"  missing: {before_miss} -> {after_miss}")
+        return lines
+
+
+__all__ = ("PathAnalysis", "default_base_path")
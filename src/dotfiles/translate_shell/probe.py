@@ -0,0 +1,164 @@
+"""
+Probes the platform once and caches the results
+
+Computes the platform, Linux distribution, desktop status, and app directories.
+The snapshot is persisted in `$XDG_CACHE_HOME/dotfiles/platform-probe.json`,
+and is invalidated when `$HOME` or the os-release file changes (or it gets too old).
+It is only rewritten when the results change, so reprobing doesn't disturb anything keyed on it.
+
+Like `cache`, this does not depend on `__main__`.
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from dotfiles.translate_shell.cache import atomic_write, cache_dir
+
+PROBE_VERSION = 2
+"""Incremented whenever the format or detection logic changes"""
+MAX_AGE_SECONDS = 24 * 60 * 60
+"""
+Reprobe at least once a day, to notice things like an Xorg installation
+
+The age is the mtime of the cache file, so an unchanged result only needs a touch.
+"""
+
+OS_RELEASE_FILES = ("/etc/os-release", "/usr/lib/os-release", "/etc/lsb-release")
+
+# Keys match the names of AppDir members
+APP_DIR_LOCATIONS: dict[str, dict[str, str]] = {
+    # linux is easy (designed that way)
+    "linux": {
+        "USER_CONFIG": "~/.config",
+        "USER_DATA": "~/.local/share",
+    },
+    "darwin": {
+        "USER_CONFIG": "~/Library/Application Support",
+        "USER_DATA": "~/Library/Application Support",
+    },
+}
+
+
+@dataclass(frozen=True)
+class PlatformSnapshot:
+    platform: str
+    """The value of `sys.platform`"""
+    distro: str | None
+    """The lowercase distribution id (like `arch`), or `None` if unknown or not on Linux"""
+    is_desktop: bool
+    app_dirs: dict[str, str | None]
+    """Maps AppDir names to their resolved paths, or `None` if the directory is missing"""
+
+
+def _find_os_release() -> str | None:
+    for name in OS_RELEASE_FILES:
+        if os.path.isfile(name):
+            return name
+    return None
+
+
+def _parse_distro(release_file: str) -> str | None:
+    """Parse the `ID` from os-release, or `DISTRIB_ID` from lsb-release"""
+    key = "DISTRIB_ID" if release_file.endswith("lsb-release") else "ID"
+    try:
+        with open(release_file, "rt") as f:
+            for line in f:
+                name, sep, value = line.strip().partition("=")
+                if sep and name == key:
+                    return value.strip().strip("\"'").lower() or None
+    except OSError:
+        pass
+    return None
+
+
+def _has_xorg() -> bool:
+    # Same as `which("Xorg")` in __main__, without the circular import
+    for path_dir in os.getenv("PATH", "").split(os.pathsep):
+        if path_dir and os.access(os.path.join(path_dir, "Xorg"), os.F_OK | os.X_OK):
+            return True
+    return False
+
+
+def resolve_app_dir(platform: str, name: str) -> Path:
+    """Determine where the named app directory is located, raising `KeyError` if unknown"""
+    return Path(APP_DIR_LOCATIONS[platform][name]).expanduser()
+
+
+def _probe() -> PlatformSnapshot:
+    platform = sys.platform
+    distro = None
+    is_desktop = False
+    if platform == "linux":
+        if (release_file := _find_os_release()) is not None:
+            distro = _parse_distro(release_file)
+        # Check for X11 installation
+        is_desktop = _has_xorg()
+    elif platform == "darwin":
+        is_desktop = True  # consider macs always desktops ;)
+    app_dirs: dict[str, str | None] = {}
+    for name in APP_DIR_LOCATIONS.get(platform, {}):
+        path = resolve_app_dir(platform, name)
+        app_dirs[name] = str(path) if path.is_dir() else None
+    return PlatformSnapshot(platform=platform, distro=distro, is_desktop=is_desktop, app_dirs=app_dirs)
+
+
+def _cache_key() -> dict[str, Any]:
+    release_file = _find_os_release() if sys.platform == "linux" else None
+    return {
+        "version": PROBE_VERSION,
+        "platform": sys.platform,
+        # Not $PATH, which varies between shells (and would force a reprobe for each one)
+        "home": os.path.expanduser("~"),
+        "release_file": release_file,
+        "release_mtime_ns": os.stat(release_file).st_mtime_ns if release_file is not None else None,
+    }
+
+
+def _cache_file() -> Path:
+    return cache_dir() / "platform-probe.json"
+
+
+@functools.cache
+def current_snapshot() -> PlatformSnapshot:
+    """The snapshot of the current platform, loaded from the cache if still valid"""
+    key = _cache_key()
+    cache_file = _cache_file()
+    cached: Any = None
+    try:
+        with open(cache_file, "rb") as f:
+            cached = json.load(f)
+            age = time.time() - os.fstat(f.fileno()).st_mtime
+        if cached["key"] == key and age < MAX_AGE_SECONDS:
+            return PlatformSnapshot(**cached["snapshot"])
+    except (FileNotFoundError, ValueError, KeyError, TypeError):
+        pass
+    snapshot = _probe()
+    data = {"key": key, "snapshot": asdict(snapshot)}
+    try:
+        if data == cached:
+            os.utime(cache_file)  # unchanged, so only reset the age
+        else:
+            atomic_write(cache_file, json.dumps(data, indent=2).encode())
+    except OSError:
+        pass  # caching is only an optimization
+    return snapshot
+
+
+def invalidate() -> None:
+    """Discard the cached snapshot, forcing the next call to reprobe"""
+    current_snapshot.cache_clear()
+    try:
+        os.unlink(_cache_file())
+    except FileNotFoundError:
+        pass
+
+
+__all__ = ("PlatformSnapshot", "current_snapshot", "invalidate", "resolve_app_dir")